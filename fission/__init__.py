@@ -1,3 +1,65 @@
+import argparse
+from contextlib import ExitStack
+
+
+def _sweep_options(batched=False):
+    """
+    Reads the options of the sweep scripts from the command line
+
+    Parameters:
+        batched (bool): Whether the script also takes --batched, to run replicas together with run_batch
+
+    Returns:
+        dict: jobs, the number of processes to run the simulations on, seed, the root seed of the sweep,
+            manifest, the path of the manifest file, cache, the path of the result cache, and cache_size, its
+            largest size(in MB), with batched when asked for
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=1, help="number of processes to run the simulations on")
+    parser.add_argument("--seed", type=int, default=None, help="root seed, for reproducible sweeps")
+    parser.add_argument("--manifest", default=None, help="file recording finished simulations, to resume from")
+    parser.add_argument("--cache", default=None, help="file caching simulation results, shared between scripts")
+    parser.add_argument("--cache-size", type=float, default=256, help="largest size of the cache file in MB")
+    if batched:
+        parser.add_argument("--batched", action="store_true", help="advance the replicas of a batch together")
+    return vars(parser.parse_args())
+
+
+def _run_sweep(sweep, batched=False):
+    """
+    Runs a sweep with the options of the command line, recording its finished simulations in the manifest
+    given with --manifest and taking those already run from the result cache given with --cache
+
+    Parameters:
+        sweep (function): Sweep function of the analysis module
+        batched (bool): Whether the sweep takes the batched option
+
+    Returns:
+        None
+    """
+    from .cache import ResultCache
+    from .manifest import SweepManifest
+
+    options = _sweep_options(batched)
+    cache_size = options.pop("cache_size")
+    with ExitStack() as stack:
+        if options["manifest"] is not None:
+            manifest = stack.enter_context(SweepManifest(options["manifest"]))
+            if manifest.num_loaded > 0:
+                print("Resuming from", manifest.path, "with", manifest.num_loaded, "finished items")
+            options["manifest"] = manifest
+        if options["cache"] is not None:
+            options["cache"] = stack.enter_context(ResultCache(options["cache"], int(cache_size * 2**20)))
+        sweep(**options)
+
+        if options["cache"] is not None:
+            report = options["cache"].report()
+            print(
+                f"Result cache: {report['hits']} hits, {report['misses']} misses, {report['evictions']} evictions,",
+                f"{report['entries']} entries",
+            )
+
+
 def main_program():
     from .simulation import main
 
@@ -7,34 +69,64 @@ def main_program():
 def heat_vs_uranium():
     from .analysis import heat_release_vs_uranium
 
-    heat_release_vs_uranium()
+    _run_sweep(heat_release_vs_uranium)
 
 
 def heatmap():
     from .analysis import heat_release_heatmap
 
-    heat_release_heatmap()
+    _run_sweep(heat_release_heatmap)
 
 
 def heattime_vs_simulations():
     from .analysis import heattime_vs_simulations
 
-    heattime_vs_simulations()
+    _run_sweep(heattime_vs_simulations, batched=True)
 
 
 def computation_vs_uraniums():
     from .analysis import computation_vs_uraniums
 
-    computation_vs_uraniums()
+    _run_sweep(computation_vs_uraniums)
 
 
 def computation_vs_neutrons():
     from .analysis import computation_vs_neutrons
 
-    computation_vs_neutrons()
+    _run_sweep(computation_vs_neutrons)
 
 
 def heattime_vs_timestep():
     from .analysis import heattime_vs_timestep
 
-    heattime_vs_timestep()
+    _run_sweep(heattime_vs_timestep, batched=True)
+
+
+def particle_benchmark():
+    from .benchmark import particle_object_benchmark
+
+    particle_object_benchmark()
+
+
+def precision_benchmark():
+    from .benchmark import precision_benchmark
+
+    precision_benchmark()
+
+
+def integrator_benchmark():
+    from .benchmark import integrator_benchmark
+
+    integrator_benchmark()
+
+
+def k_effective():
+    from .criticality import main
+
+    main()
+
+
+def surrogate_heat_vs_uranium():
+    from .analysis import surrogate_heat_vs_uranium
+
+    _run_sweep(surrogate_heat_vs_uranium)
@@ -2,13 +2,25 @@
 import numpy as np
 import statistics
 import matplotlib.pyplot as plt
-from .simulation import run_simulation  # Import the function from Simulation.py
+from .batched import run_batch  # Runs many replicas of a small simulation together
+from .ensemble import point_seed, run_ensemble  # Runs the simulations of a sweep over a pool of processes
+from .manifest import root_seed
+from .scheduler import run_scheduled  # Runs the longest simulations of a sweep first
+from .surrogate import MeanFieldSurrogate, monte_carlo_means
 
 
-def heat_release_vs_uranium():
+def heat_release_vs_uranium(jobs=1, seed=None, manifest=None, cache=None):
     """
     Generates plot of temperature change vs. number of uranium atoms for a set number of Neutron objects, box size and time step
 
+    Parameters:
+        jobs (int): Number of processes the simulations are spread over
+        seed (int or None): Root seed of the simulations, None for fresh entropy from the system
+        manifest (SweepManifest): Manifest recording every finished simulation, so an interrupted sweep resumes
+            where it stopped, None to keep results in memory only
+        cache (ResultCache): Cache of the results of earlier simulations, shared by every sweep with the same
+            seed, None to run every simulation
+
     Returns:
         None
     Outputs:
@@ -24,13 +36,13 @@ def heat_release_vs_uranium():
     uranium_range = (1, 50, 100, 300, 700, 1000)
     temp_changes = []
 
-    for num_uranium in uranium_range:
-        # Run the simulation to get the temperature change
-        particles, temp_change, total_time = run_simulation(
-            num_neutrons, num_uranium, box_dim, dt
-        )
-        temp_changes.append(temp_change)
-        print(total_time)
+    # Run the simulations to get the temperature changes, the largest first
+    points = [(num_neutrons, num_uranium, box_dim, dt) for num_uranium in uranium_range]
+    report = {}
+    for (run,) in run_scheduled(points, seed=seed, jobs=jobs, manifest=manifest, cache=cache, report=report):
+        temp_changes.append(run["temp_change"])
+        print(run["total_time"])
+    print("Worker utilization:", report["utilization"])
 
     # Plot the heat released as a function of the number of uranium atoms
     plt.figure()
@@ -49,10 +61,19 @@ def heat_release_vs_uranium():
     plt.show()
 
 
-def computation_vs_uraniums():
+def computation_vs_uraniums(jobs=1, seed=None, manifest=None, cache=None):
     """
     Generates plot of computation time vs. number of uranium atoms for a set number of Neutron objects, box size and time step
 
+    Parameters:
+        jobs (int): Number of processes the simulations are spread over, with more than one the simulations
+            compete for the machine and their times grow with the load
+        seed (int or None): Root seed of the simulations, None for fresh entropy from the system
+        manifest (SweepManifest): Manifest recording every finished simulation, so an interrupted sweep resumes
+            where it stopped, None to keep results in memory only
+        cache (ResultCache): Not used, a cached simulation keeps the time it took on its first run, so every
+            simulation of a timing sweep is timed again
+
     Returns:
         None
     Outputs:
@@ -84,15 +105,16 @@ def computation_vs_uraniums():
     )
     time_list = []
 
-    for num_uranium in uranium_range:
-        uranium_time_list = []
-        for i in range(0, 5):
-            particles, temp_change, total_time = run_simulation(
-                num_neutrons, num_uranium, box_dim, dt
-            )
-            uranium_time_list.append(total_time)
+    # Larger simulations take far longer, so they are scheduled first to keep every process busy
+    points = [(num_neutrons, num_uranium, box_dim, dt) for num_uranium in uranium_range]
+    if jobs > 1:
+        print("Warning: with --jobs", jobs, "the simulations are timed while competing for the machine")
+    report = {}
+    for runs in run_scheduled(points, 5, seed, jobs, manifest=manifest, report=report):
+        uranium_time_list = [run["total_time"] for run in runs]
         avg_time = statistics.mean(uranium_time_list)
         time_list.append(avg_time)
+    print("Worker utilization:", report["utilization"])
 
     plt.figure()
     plt.plot(
@@ -110,10 +132,19 @@ def computation_vs_uraniums():
     plt.show()
 
 
-def computation_vs_neutrons():
+def computation_vs_neutrons(jobs=1, seed=None, manifest=None, cache=None):
     """
     Generates plot of computation time vs. number of neutron particles for a set number of Uranium objects, box size and time step
 
+    Parameters:
+        jobs (int): Number of processes the simulations are spread over, with more than one the simulations
+            compete for the machine and their times grow with the load
+        seed (int or None): Root seed of the simulations, None for fresh entropy from the system
+        manifest (SweepManifest): Manifest recording every finished simulation, so an interrupted sweep resumes
+            where it stopped, None to keep results in memory only
+        cache (ResultCache): Not used, a cached simulation keeps the time it took on its first run, so every
+            simulation of a timing sweep is timed again
+
     Returns:
         None
     Outputs:
@@ -145,15 +176,16 @@ def computation_vs_neutrons():
     )
     time_list = []
 
-    for num_neutron in neutron_range:
-        neutron_time_list = []
-        for i in range(0, 5):
-            particles, temp_change, total_time = run_simulation(
-                num_neutron, num_uraniums, box_dim, dt
-            )
-            neutron_time_list.append(total_time)
+    # Larger simulations take far longer, so they are scheduled first to keep every process busy
+    points = [(num_neutron, num_uraniums, box_dim, dt) for num_neutron in neutron_range]
+    if jobs > 1:
+        print("Warning: with --jobs", jobs, "the simulations are timed while competing for the machine")
+    report = {}
+    for runs in run_scheduled(points, 5, seed, jobs, manifest=manifest, report=report):
+        neutron_time_list = [run["total_time"] for run in runs]
         avg_time = statistics.mean(neutron_time_list)
         time_list.append(avg_time)
+    print("Worker utilization:", report["utilization"])
 
     plt.figure()
     plt.plot(
@@ -171,10 +203,18 @@ def computation_vs_neutrons():
     plt.show()
 
 
-def heat_release_heatmap():
+def heat_release_heatmap(jobs=1, seed=None, manifest=None, cache=None):
     """
     Creates a heatmap showing the temperature change vs. number of uranium atoms for set box size, time step and number of Neutron objects
 
+    Parameters:
+        jobs (int): Number of processes the simulations are spread over
+        seed (int or None): Root seed of the simulations, None for fresh entropy from the system
+        manifest (SweepManifest): Manifest recording every finished simulation, so an interrupted sweep resumes
+            where it stopped, None to keep results in memory only
+        cache (ResultCache): Cache of the results of earlier simulations, shared by every sweep with the same
+            seed, None to run every simulation
+
     Returns:
         None
     Outputs:
@@ -217,17 +257,18 @@ def heat_release_heatmap():
     )
     box_sizes = np.array([0.000001])
 
-    # Initialize a 2D array to store temperature changes
-    temp_changes = np.zeros((len(box_sizes), len(uranium_range)))
-
     # Run the simulation for each combination of box size and number of uranium atoms
-    for i, box_dim in enumerate(box_sizes):
-        for j, num_uranium in enumerate(uranium_range):
-            # Run the simulation to get the temperature change
-            particles, temp_change, total_time = run_simulation(
-                num_neutrons, num_uranium, box_dim, dt
-            )
-            temp_changes[i, j] = temp_change
+    points = [
+        (num_neutrons, num_uranium, box_dim, dt)
+        for box_dim in box_sizes
+        for num_uranium in uranium_range
+    ]
+    runs = run_ensemble(points, seed=seed, jobs=jobs, manifest=manifest, cache=cache)
+
+    # 2D array of the temperature changes, one row per box size
+    temp_changes = np.array([run["temp_change"] for (run,) in runs]).reshape(
+        len(box_sizes), len(uranium_range)
+    )
 
     # Create the heatmap
     plt.figure()
@@ -248,10 +289,20 @@ def heat_release_heatmap():
     plt.show()
 
 
-def heattime_vs_timestep():
+def heattime_vs_timestep(jobs=1, seed=None, batched=False, manifest=None, cache=None):
     """ "
     Creates graph of average temperature change, standard deviation of temperature change, average simulation time and standard deviation of simulation time all vs different time steps
 
+    Parameters:
+        jobs (int): Number of processes the simulations are spread over
+        seed (int or None): Root seed of the simulations, None for fresh entropy from the system
+        batched (bool): Whether to run the replicas of every batch together with run_batch, in this process,
+            plotting the time of every batch instead of the average and standard deviation of the simulation time
+        manifest (SweepManifest): Manifest recording every finished simulation, so an interrupted sweep resumes
+            where it stopped, None to keep results in memory only
+        cache (ResultCache): Cache of the results of earlier simulations, shared by every sweep with the same
+            seed, None to run every simulation
+
     Returns:
         None
     Outputs:
@@ -279,23 +330,26 @@ def heattime_vs_timestep():
     average_time = []
     stdev_avg_time = []
 
-    for dt in dt_range:
-        simulation_num = 1
-        sim_temp_change_list = []
-        sim_total_time_list = []
-
-        while simulation_num <= 25:
-            particles, temp_change, total_time = run_simulation(
-                num_neutrons, num_uraniums, box_dim, dt
-            )
-            sim_temp_change_list.append(temp_change)
-            sim_total_time_list.append(total_time)
-            simulation_num += 1
-
-        average_temp_change.append(statistics.mean(sim_temp_change_list))
-        stdev_temp_change.append(statistics.stdev(sim_temp_change_list))
-        average_time.append(statistics.mean(sim_total_time_list))
-        stdev_avg_time.append(statistics.stdev(sim_total_time_list))
+    points = [(num_neutrons, num_uraniums, box_dim, dt) for dt in dt_range]
+    if batched:
+        # the replicas of a batch run together and are never timed one by one, so only the time of the whole
+        # batch is plotted and there is no standard deviation of it
+        root = root_seed(seed, manifest)
+        for point in points:
+            batch_seed = point_seed(root, point, 25, 0)
+            temp_change, steps, total_time = run_batch(*point, 25, batch_seed, manifest=manifest, cache=cache)
+            average_temp_change.append(statistics.mean(temp_change))
+            stdev_temp_change.append(statistics.stdev(temp_change))
+            average_time.append(total_time)
+    else:
+        for runs in run_ensemble(points, 25, seed, jobs, manifest, cache):
+            sim_temp_change_list = [run["temp_change"] for run in runs]
+            sim_total_time_list = [run["total_time"] for run in runs]
+
+            average_temp_change.append(statistics.mean(sim_temp_change_list))
+            stdev_temp_change.append(statistics.stdev(sim_temp_change_list))
+            average_time.append(statistics.mean(sim_total_time_list))
+            stdev_avg_time.append(statistics.stdev(sim_total_time_list))
 
     plt.figure()
     plt.plot(
@@ -335,25 +389,29 @@ def heattime_vs_timestep():
     plt.grid(True)
     plt.show()
 
+    time_label = "Batch Simulation Time" if batched else "Average Simulation Time"
     plt.figure()
     plt.plot(
         dt_range,
         average_time,
-        label="Average Simulation Time",
+        label=time_label,
         color="blue",
         marker="o",
     )
 
     # Label the axes
     plt.xlabel("Size of Time Step")
-    plt.ylabel("Average Simulation Time")
-    plt.title("Average Simulation Time vs. Size of Time Step")
+    plt.ylabel(time_label)
+    plt.title(time_label + " vs. Size of Time Step")
     plt.legend()
 
     # Show the plot
     plt.grid(True)
     plt.show()
 
+    if batched:
+        return
+
     plt.figure()
     plt.plot(
         dt_range,
@@ -374,10 +432,19 @@ def heattime_vs_timestep():
     plt.show()
 
 
-def heattime_vs_simulations():
+def heattime_vs_simulations(jobs=1, seed=None, batched=False, manifest=None, cache=None):
     """ "
     Creates graph of average of average temperature change, standard deviation of average of temperature change, average of standard deviation of temperature change and standard deviation of standard deviation of temperature change all vs different size simulation batches
 
+    Parameters:
+        jobs (int): Number of processes the simulations are spread over
+        seed (int or None): Root seed of the simulations, None for fresh entropy from the system
+        batched (bool): Whether to run the replicas of every batch together with run_batch, in this process
+        manifest (SweepManifest): Manifest recording every finished simulation, so an interrupted sweep resumes
+            where it stopped, None to keep results in memory only
+        cache (ResultCache): Cache of the results of earlier simulations, shared by every sweep with the same
+            seed, None to run every simulation
+
     Returns:
         None
     Outputs:
@@ -397,21 +464,33 @@ def heattime_vs_simulations():
     stdev_sim_avg_temp_list = []
     stdev_sim_stdev_temp_list = []
 
+    # Replicas are seeded by their point and number, so the batches of every size come out the same whichever
+    # batch sizes are run, and every size reuses the replicas of the smaller ones, which a result cache only runs
+    # once
+    root = root_seed(seed, manifest)
+
     for simulation in simulation_range:
         print("CURRENT NUM OF SIMULATIONS:", simulation)
         sim_average_temp_change = []
         sim_stdev_temp_change = []
 
-        for i in range(0, 100):
-            simulation_num = 1
-            temp_change_list = []
-
-            while simulation_num <= simulation:
-                particles, temp_change, total_time = run_simulation(
-                    num_neutrons, num_uraniums, box_dim, dt
-                )
-                temp_change_list.append(temp_change)
-                simulation_num += 1
+        # 100 batches of simulations, each batch one point of the ensemble or one call of run_batch
+        points = [(num_neutrons, num_uraniums, box_dim, dt)] * 100
+        if batched:
+            batches = [
+                run_batch(
+                    *point, simulation, point_seed(root, point, simulation, batch), manifest=manifest, cache=cache
+                )[0]
+                for batch, point in enumerate(points)
+            ]
+        else:
+            batches = [
+                [run["temp_change"] for run in runs]
+                for runs in run_ensemble(points, simulation, root, jobs, manifest, cache)
+            ]
+
+        for temp_change in batches:
+            temp_change_list = list(temp_change)
 
             sim_average_temp_change.append(statistics.mean(temp_change_list))
             sim_stdev_temp_change.append(statistics.stdev(temp_change_list))
@@ -505,3 +584,74 @@ def heattime_vs_simulations():
     # Show the plot
     plt.grid(True)
     plt.show()
+
+
+def surrogate_heat_vs_uranium(jobs=1, seed=None, manifest=None, cache=None):
+    """
+    Fills in the temperature change and simulated time vs. number of uranium atoms for every count from 1 to 1000
+    with the mean-field surrogate, calibrated against a few particle simulations and checked against others
+
+    Parameters:
+        jobs (int): Number of processes the particle simulations are spread over
+        seed (int or None): Root seed of the particle simulations, None for fresh entropy from the system
+        manifest (SweepManifest): Manifest recording every finished particle simulation, so an interrupted sweep
+            resumes where it stopped, None to keep results in memory only
+        cache (ResultCache): Cache of the results of earlier simulations, shared by every sweep with the same
+            seed, None to run every simulation
+
+    Returns:
+        None
+    Outputs:
+        Prints the calibration and held-out errors of the surrogate, then displays graphs of temperature change
+        and simulated time vs. number of uranium atoms, surrogate curves with the Monte Carlo points
+    """
+    # Simulation parameters (common to all runs)
+    num_neutrons = 4
+    box_dim = 0.5  # Box dimension in meters
+    dt = 1e-3
+    replicas = 5
+
+    # Points the surrogate is calibrated on, a few box sizes and time steps included, and held-out points
+    calibration_points = [(num_neutrons, num_uranium, box_dim, dt) for num_uranium in (1, 10, 100, 400)]
+    calibration_points += [(num_neutrons, 20, 0.25, dt), (num_neutrons, 20, 1.0, dt)]
+    calibration_points += [(num_neutrons, 2, box_dim, 1e-4)]
+    held_out_points = [(num_neutrons, num_uranium, box_dim, dt) for num_uranium in (50, 200, 700)]
+
+    # the calibration and held-out points differ, so they can share the root seed and reuse the replicas of
+    # the other sweeps from a result cache
+    root = root_seed(seed, manifest)
+    surrogate = MeanFieldSurrogate()
+    calibration_means = monte_carlo_means(calibration_points, replicas, root, jobs, manifest, cache)
+    time_error, drag_error = surrogate.calibrate(calibration_points, means=calibration_means)
+    print("RMS log error of the calibration, simulated time:", time_error, "drag energy:", drag_error)
+
+    held_out_means = monte_carlo_means(held_out_points, replicas, root, jobs, manifest, cache)
+    errors = surrogate.heldOutError(held_out_points, means=held_out_means)
+    for key, error in errors.items():
+        print(f"Mean relative error of {key} on held-out points:", error)
+
+    # Dense sweep with the surrogate only
+    uranium_range = np.arange(1, 1001)
+    predicted = surrogate.sweep([(num_neutrons, num_uranium, box_dim, dt) for num_uranium in uranium_range])
+
+    measured_uranium = [point[1] for point in calibration_points[:4] + held_out_points]
+    measured = calibration_means[:4] + held_out_means
+    for key, label in (("temp_change", "Temperature Change ('C)"), ("sim_time", "Simulated Time (s)")):
+        plt.figure()
+        plt.plot(uranium_range, predicted[key], label="Surrogate", color="blue")
+        plt.plot(
+            measured_uranium,
+            [means[key] for means in measured],
+            label="Monte Carlo",
+            color="red",
+            marker="o",
+            linestyle="none",
+        )
+
+        # Label the axes
+        plt.xlabel("Number of Uranium Atoms")
+        plt.ylabel(label)
+        plt.title(f"{label} vs. Number of Uranium Atoms")
+        plt.legend()
+        plt.grid(True)
+    plt.show()
@@ -0,0 +1,289 @@
+# replica-batched step engine, many small independent simulations advanced together in one set of arrays
+import numpy as np
+import time
+from .kernels import elasticCollisionBatch
+from .reaction import FISSION_PRODUCTS, fissionBatch, heatRelease, matchPairs
+from .species import SPECIES, NEUTRON, URANIUM
+
+
+class BatchedSimulation:
+    """
+    A class advancing R independent replicas of one simulation together, for the many tiny simulations of the
+    analysis sweeps whose cost is Python overhead rather than physics. Every particle array has a leading
+    replica axis and C particle slots per replica, C being enough for every fission to come, and an alive mask
+    tells which slots hold a particle: fission frees the slots of its neutron and uranium atom and fills free
+    slots of the same replica with its products. Replicas whose uranium has run out, or which have no neutron
+    left, are dropped from the arrays, so the steps left are only paid for by the replicas still running.
+
+    Every step follows step_simulation with the default options: an explicit Euler drag step and wall
+    reflection as in StepKernel, then neutron-uranium contacts undergo fission, closest pairs first and every
+    particle in at most one reaction, and the other pairs in contact collide elastically as with matchPairs.
+    Contacts are found by testing every pair of slots of a replica, so memory grows with R * C^2 and the class
+    is meant for simulations of a few particles.
+
+    Attributes:
+        box_dim (float): Half of the length of one side of the cubic box
+        dt (float): The size of time step
+        capacity (int): Number of particle slots of every replica
+        steps (ndarray): R array with the number of steps taken by every replica
+        fissions (ndarray): R array with the number of fissions of every replica
+        drag_energy (ndarray): R array with the energy(in J) every replica transferred to the water by drag
+        running (ndarray): Ids of the replicas still running, the rows of the particle arrays
+    """
+
+    def __init__(self, num_neutrons, num_uranium, box_dim, dt, replicas, rng=np.random):
+        """
+        Initializes a BatchedSimulation object, distributing the particles of every replica as generate_store
+
+        Parameters:
+            num_neutrons (int): The number of neutrons generated within the box of every replica
+            num_uranium (int): The number of uranium atoms generated within the box of every replica
+            box_dim (float): Half of the length of one side of the cubic box
+            dt (float): The size of time step for updating particle's position and velocities
+            replicas (int): Number of independent replicas
+            rng (Generator): Random number generator, defaults to numpy's global one
+        """
+        self.box_dim = box_dim
+        self.dt = dt
+        self.rng = rng
+        # every fission replaces a neutron and a uranium atom by its products
+        self.capacity = num_neutrons + num_uranium * (len(FISSION_PRODUCTS) - 1)
+        self.steps = np.zeros(replicas, dtype=np.int64)
+        self.fissions = np.zeros(replicas, dtype=np.int64)
+        self.drag_energy = np.zeros(replicas)
+        self.running = np.arange(replicas)
+
+        num_particles = num_neutrons + num_uranium
+        self.pos = np.zeros((replicas, self.capacity, 3))
+        self.vel = np.zeros((replicas, self.capacity, 3))
+        self.species = np.full((replicas, self.capacity), NEUTRON, dtype=np.int64)
+        self.species[:, num_neutrons:num_particles] = URANIUM
+        self.alive = np.zeros((replicas, self.capacity), dtype=bool)
+        self.alive[:, :num_particles] = True
+        self.num_uranium = np.full(replicas, num_uranium, dtype=np.int64)
+
+        # Neutrons move faster than uranium, as in generate_store
+        self.pos[:, :num_neutrons] = rng.exponential(scale=box_dim / 5, size=(replicas, num_neutrons, 3))
+        self.vel[:, :num_neutrons] = rng.exponential(scale=50, size=(replicas, num_neutrons, 3))
+        self.pos[:, num_neutrons:num_particles] = rng.exponential(
+            scale=box_dim / 5, size=(replicas, num_uranium, 3)
+        )
+        self.vel[:, num_neutrons:num_particles] = rng.exponential(scale=10, size=(replicas, num_uranium, 3))
+
+        # every pair of slots of a replica, each unordered pair once
+        self._first, self._second = np.triu_indices(self.capacity, 1)
+        self._drop(self._finished())
+
+    def _finished(self):
+        """
+        Tells which replicas can take no more steps, those left without uranium or without any neutron to
+        react with it
+
+        Returns:
+            ndarray: Boolean mask over the rows, True for the finished replicas
+        """
+        has_neutrons = np.any(self.alive & (self.species == NEUTRON), axis=1)
+        return (self.num_uranium == 0) | ~has_neutrons
+
+    def _drop(self, finished):
+        """
+        Removes the rows of finished replicas from the particle arrays
+
+        Parameters:
+            finished (ndarray): Boolean mask over the rows, True for the replicas to remove
+
+        Returns:
+            None
+        """
+        if not np.any(finished):
+            return
+        keep = ~finished
+        self.running = self.running[keep]
+        self.pos = self.pos[keep]
+        self.vel = self.vel[keep]
+        self.species = self.species[keep]
+        self.alive = self.alive[keep]
+        self.num_uranium = self.num_uranium[keep]
+
+    def _move(self):
+        """
+        Moves every particle by one explicit Euler step of drag, as StepKernel, and reflects it at the walls
+
+        Returns:
+            ndarray: Energy(in J) transferred to the water by drag during the step, one value per row
+        """
+        pos = self.pos
+        vel = self.vel
+        species = self.species
+        dt = self.dt
+
+        # Drag acts on every component, then the position update, empty slots stay at rest
+        vel -= np.square(vel) * SPECIES.drag_prefactor[species][..., None] * dt
+        pos += vel * dt
+        speed_sq = np.einsum("rij,rij->ri", vel, vel)
+        drag_energy = np.sum(np.sqrt(speed_sq) * speed_sq * SPECIES.force_prefactor[species], axis=1) * dt
+
+        # the z-wall is checked against a padded radius, as in Particle.collideWall
+        radius = SPECIES.radius[species][..., None]
+        hit = np.abs(pos) + radius * np.array([1.0, 1.0, 1.0e3]) >= self.box_dim
+        hit &= self.alive[..., None]
+        np.negative(vel, out=vel, where=hit)
+        np.copyto(pos, np.sign(pos) * (self.box_dim - radius), where=hit)
+        return drag_energy
+
+    def _contacts(self):
+        """
+        Finds every pair of particles in contact within each replica
+
+        Returns:
+            ndarray: K x 2 array of the pairs in contact, as indices into the flattened slots of every row
+            ndarray: K array with the distance(in m) between the particles of each pair
+        """
+        first = self._first
+        second = self._second
+        dist = np.linalg.norm(self.pos[:, first] - self.pos[:, second], axis=2)
+        contact_radius = SPECIES.contact_radius[self.species]
+        touching = dist <= contact_radius[:, first] + contact_radius[:, second]
+        touching &= self.alive[:, first] & self.alive[:, second]
+
+        rows, pair_index = np.nonzero(touching)
+        offset = rows * self.capacity
+        pairs = np.stack((offset + first[pair_index], offset + second[pair_index]), axis=1)
+        return pairs, dist[rows, pair_index]
+
+    def step(self):
+        """
+        Advances every running replica by one time step and drops the replicas left without uranium or neutrons
+
+        Returns:
+            None
+        """
+        num_rows = len(self.running)
+        capacity = self.capacity
+        self.drag_energy[self.running] += self._move()
+        self.steps[self.running] += 1
+
+        pos = self.pos.reshape(-1, 3)
+        vel = self.vel.reshape(-1, 3)
+        species = self.species.reshape(-1)
+        alive = self.alive.reshape(-1)
+        pairs, dist = self._contacts()
+
+        # Neutron-uranium contacts undergo fission, closest pairs first, each particle at most once
+        pair_species = species[pairs]
+        is_fission_pair = (pair_species[:, 0] != pair_species[:, 1]) & np.all(
+            (pair_species == NEUTRON) | (pair_species == URANIUM), axis=1
+        )
+        fission_pairs = pairs[is_fission_pair]
+        swap = species[fission_pairs[:, 0]] != NEUTRON
+        fission_pairs[swap] = fission_pairs[swap, ::-1]
+        reacting = fission_pairs[matchPairs(fission_pairs, dist[is_fission_pair])]
+        neutron_slots = reacting[:, 0]
+        uranium_slots = np.sort(reacting[:, 1])
+        reactions = np.bincount(uranium_slots // capacity, minlength=num_rows)
+        self.num_uranium -= reactions
+        self.fissions[self.running] += reactions
+
+        product_species, product_pos, product_vel = fissionBatch(pos[uranium_slots], self.rng)
+        consumed = np.zeros(len(species), dtype=bool)
+        consumed[neutron_slots] = True
+        consumed[uranium_slots] = True
+
+        # Elastic collisions of the particles left, each particle in at most one contact per step
+        pairs = pairs[~is_fission_pair]
+        dist = dist[~is_fission_pair]
+        free = ~(consumed[pairs[:, 0]] | consumed[pairs[:, 1]])
+        pairs = pairs[free]
+        colliding = pairs[matchPairs(pairs, dist[free])]
+        elasticCollisionBatch(pos, vel, SPECIES.mass[species], species, colliding, self.rng)
+
+        # Empty the slots of the reactants, then put the products in the first free slots of their replica
+        alive[consumed] = False
+        pos[consumed] = 0.0
+        vel[consumed] = 0.0
+        if len(product_species) > 0:
+            product_rows = np.repeat(uranium_slots // capacity, len(FISSION_PRODUCTS))
+            rank = np.arange(len(product_rows)) - np.searchsorted(product_rows, product_rows)
+            free_slots = np.argsort(self.alive, axis=1, kind="stable")
+            slots = product_rows * capacity + free_slots[product_rows, rank]
+            species[slots] = product_species
+            pos[slots] = product_pos
+            vel[slots] = product_vel
+            alive[slots] = True
+
+        self._drop(self._finished())
+
+    def run(self):
+        """
+        Steps the running replicas until every replica has used up its uranium or has no neutron left
+
+        Returns:
+            ndarray: R array with the change in temperature of the water of every replica
+        """
+        while len(self.running) > 0:
+            self.step()
+        temp_change, _ = heatRelease(self.fissions, self.box_dim, self.drag_energy)
+        return temp_change
+
+
+def run_batch(
+    num_neutrons, num_uranium, box_dim, dt, replicas, seed=None, stats=None, manifest=None, cache=None
+):
+    """
+    Runs many replicas of one small simulation together with a BatchedSimulation, the batched form of calling
+    run_simulation with the default options once per replica. With a manifest the whole batch is one work item,
+    taken from the manifest when it is recorded there and recorded once it has run. A result cache likewise
+    holds whole batches, for a seed given as a SeedSequence.
+
+    Parameters:
+        num_neutrons (int): The number of neutrons initially present in every replica
+        num_uranium (int): The number of uranium atoms initially present in every replica
+        box_dim (float): Half of the length of one side of the cubic box the particles will be simulated in
+        dt (float): The size of time step for updating particle's position and velocities
+        replicas (int): Number of independent replicas
+        seed (int, SeedSequence or Generator): Seed of the random numbers of the batch, so the same seed gives
+            the same batch, None to draw from numpy's global random state
+        stats (dict): Optional dictionary filled with the fissions, drag_energy(in J) and sim_time(in s) of every
+            replica
+        manifest (SweepManifest): Manifest recording finished batches, seed then being a SeedSequence under its
+            root seed, None to always run the batch
+        cache (ResultCache): Cache of the results of earlier batches, only used when seed is a SeedSequence,
+            None to always run the batch
+
+    Returns:
+        ndarray: R array with the change in temperature within the box of every replica
+        ndarray: R array with the number of steps taken by every replica
+        float: The total time elapsed running the whole batch
+    """
+    point = (num_neutrons, num_uranium, box_dim, dt)
+    result = None if manifest is None else manifest.get(point, replicas, seed)
+    if not isinstance(seed, np.random.SeedSequence):
+        cache = None
+    # batches are told apart from run_simulation results with the same seed by their engine and size
+    key = None if cache is None else cache.key(point, seed, {"engine": "batched", "replicas": replicas})
+    if result is None and cache is not None:
+        result = cache.get(key)
+        if result is not None and manifest is not None:
+            manifest.record(point, replicas, seed, result)
+    if result is None:
+        start_time = time.time()
+        rng = np.random if seed is None else np.random.default_rng(seed)
+        batch = BatchedSimulation(num_neutrons, num_uranium, box_dim, dt, replicas, rng)
+        result = {
+            "temp_change": batch.run(),
+            "steps": batch.steps,
+            "fissions": batch.fissions,
+            "drag_energy": batch.drag_energy,
+            "total_time": time.time() - start_time,
+        }
+        if manifest is not None:
+            # the replica number of a batch item is its number of replicas
+            manifest.record(point, replicas, seed, result)
+        if cache is not None:
+            cache.put(key, result)
+
+    if stats is not None:
+        stats["fissions"] = np.asarray(result["fissions"])
+        stats["drag_energy"] = np.asarray(result["drag_energy"])
+        stats["sim_time"] = np.asarray(result["steps"]) * dt
+    return np.asarray(result["temp_change"]), np.asarray(result["steps"]), result["total_time"]
@@ -0,0 +1,194 @@
+# Benchmarks for the particle objects and simulation engines
+import time
+import tracemalloc
+import statistics
+import numpy as np
+from .kernels import StepKernel, dragFlight
+from .particle import Uranium
+from .simulation import generate_store, run_simulation
+
+
+def particle_object_benchmark(num_particles=20000, dt=1e-3):
+    """
+    Measures the memory used by each Particle object and the time taken by Particle.move
+
+    Parameters:
+        num_particles (int): The number of Uranium objects to create and move
+        dt (float): The size of time step passed to Particle.move
+
+    Returns:
+        float: Memory(in bytes) per particle, including its pos and vel arrays
+        float: Time(in s) per call to Particle.move
+    Outputs:
+        Prints both measurements
+    """
+    tracemalloc.start()
+    particles = [
+        Uranium(np.random.uniform(-0.5, 0.5, 3), np.random.exponential(10, 3))
+        for i in range(num_particles)
+    ]
+    memory, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start_time = time.perf_counter()
+    for particle in particles:
+        particle.move(drag_coeff=0.47, dt=dt)
+    move_time = (time.perf_counter() - start_time) / num_particles
+
+    bytes_per_particle = memory / num_particles
+    print("Memory per particle (bytes):", bytes_per_particle)
+    print("Time per move (us):", move_time * 1e6)
+    return bytes_per_particle, move_time
+
+
+def precision_benchmark(
+    num_particles=50000,
+    num_steps=200,
+    num_neutrons=4,
+    num_uranium=50,
+    box_dim=0.5,
+    dt=1e-3,
+    num_runs=20,
+):
+    """
+    Compares float32 and float64 particle storage: throughput of the step kernel on a large population, the
+    memory a kernel step allocates, measured with tracemalloc for one time step for all particles and one per
+    particle, and temperature change of seeded simulations run at both precisions
+
+    Parameters:
+        num_particles (int): The number of particles advanced by the step kernel
+        num_steps (int): The number of kernel steps timed
+        num_neutrons (int): The number of neutrons in every simulation
+        num_uranium (int): The number of uranium atoms in every simulation
+        box_dim (float): Half of the length of one side of the cubic box
+        dt (float): The size of time step
+        num_runs (int): The number of seeded simulations run at each precision
+
+    Returns:
+        dict: Kernel particle-steps per second, peak bytes allocated by a kernel step and mean temperature change
+            for each precision, and the mean relative drift of temp_change between float32 and float64
+    Outputs:
+        Prints the same results
+    """
+    results = {}
+    for precision in ("float64", "float32"):
+        np.random.seed(0)
+        store = generate_store(num_particles // 10, num_particles - num_particles // 10, box_dim, precision)
+        kernel = StepKernel()
+        kernel.step(store, dt, box_dim)
+        start_time = time.perf_counter()
+        for i in range(num_steps):
+            kernel.step(store, dt, box_dim)
+        throughput = num_particles * num_steps / (time.perf_counter() - start_time)
+
+        # the buffers are reserved by the steps above, so only memory allocated by the steps themselves is traced
+        step_bytes = []
+        for step_dt in (dt, np.full(len(store), dt)):
+            kernel.step(store, step_dt, box_dim)
+            tracemalloc.start()
+            for i in range(10):
+                kernel.step(store, step_dt, box_dim)
+            step_bytes.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        temp_changes = []
+        for seed in range(num_runs):
+            np.random.seed(seed)
+            particles, temp_change, total_time = run_simulation(
+                num_neutrons, num_uranium, box_dim, dt, precision=precision
+            )
+            temp_changes.append(temp_change)
+        results[precision] = {"throughput": throughput, "step_bytes": step_bytes, "temp_changes": temp_changes}
+
+    drift = [
+        abs(single - double) / double
+        for single, double in zip(
+            results["float32"]["temp_changes"], results["float64"]["temp_changes"]
+        )
+    ]
+    summary = {
+        "float64_throughput": results["float64"]["throughput"],
+        "float32_throughput": results["float32"]["throughput"],
+        "float64_step_bytes": results["float64"]["step_bytes"],
+        "float32_step_bytes": results["float32"]["step_bytes"],
+        "float64_temp_change": statistics.mean(results["float64"]["temp_changes"]),
+        "float32_temp_change": statistics.mean(results["float32"]["temp_changes"]),
+        "temp_change_drift": statistics.mean(drift),
+    }
+    print("Kernel particle-steps per second (float64):", summary["float64_throughput"])
+    print("Kernel particle-steps per second (float32):", summary["float32_throughput"])
+    print("Speedup:", summary["float32_throughput"] / summary["float64_throughput"])
+    for precision in ("float64", "float32"):
+        scalar_bytes, array_bytes = summary[f"{precision}_step_bytes"]
+        print(
+            f"Peak bytes allocated by a kernel step ({precision}): {scalar_bytes} with one dt,",
+            f"{array_bytes} with one dt per particle",
+        )
+    print("Mean temp change (float64):", summary["float64_temp_change"])
+    print("Mean temp change (float32):", summary["float32_temp_change"])
+    print("Mean relative drift of temp change:", summary["temp_change_drift"])
+    return summary
+
+
+def integrator_benchmark(
+    num_particles=10000, total_time=0.1, dts=(1e-4, 1e-3, 1e-2, 1e-1), box_dim=0.5, refinement=10
+):
+    """
+    Compares the explicit Euler and exact drag integrators of the step kernel: drag energy over a fixed span of
+    time at several time steps, against a reference following the same force law, and time per step. The two
+    integrators follow different drag models, Euler slowing every velocity component by its own square and the
+    exact integrator slowing the speed along the direction of motion, so each one is measured against its own
+    reference and the error only holds the integration error:
+
+    - exact: the closed-form total of dragFlight. Walls only turn velocities, so the energy of every particle
+      follows from its initial speed alone.
+    - euler: the Euler kernel itself run with a step refinement times smaller than the smallest dt compared.
+
+    Parameters:
+        num_particles (int): The number of particles advanced, a tenth of them neutrons
+        total_time (float): The span of time(in s) integrated at every time step
+        dts (tuple): The sizes of time step compared
+        box_dim (float): Half of the length of one side of the cubic box
+        refinement (int): Ratio of the smallest dt compared to the time step of the Euler reference
+
+    Returns:
+        list: One dictionary per integrator and time step with the relative drag energy error and the time(in s)
+            per step
+    Outputs:
+        Prints the reference of each integrator and the same results
+    """
+
+    def integrate(integrator, dt):
+        np.random.seed(0)
+        store = generate_store(num_particles // 10, num_particles - num_particles // 10, box_dim)
+        kernel = StepKernel(integrator)
+        num_steps = max(int(round(total_time / dt)), 1)
+        drag_energy = 0.0
+        start_time = time.perf_counter()
+        for i in range(num_steps):
+            drag_energy += kernel.step(store, dt, box_dim)
+        return drag_energy, (time.perf_counter() - start_time) / num_steps
+
+    np.random.seed(0)
+    initial = generate_store(num_particles // 10, num_particles - num_particles // 10, box_dim)
+    reference_dt = min(dts) / refinement
+    references = {
+        "euler": (integrate("euler", reference_dt)[0], f"Euler kernel at dt={reference_dt:g}"),
+        "exact": (dragFlight(initial.pos.copy(), initial.vel.copy(), initial.species, total_time), "dragFlight"),
+    }
+
+    results = []
+    for integrator in ("euler", "exact"):
+        reference, name = references[integrator]
+        print(f"{integrator:>5} reference: {name}")
+        for dt in dts:
+            drag_energy, step_time = integrate(integrator, dt)
+            error = abs(drag_energy - reference) / reference
+            results.append(
+                {"integrator": integrator, "dt": dt, "error": error, "step_time": step_time}
+            )
+            print(
+                f"{integrator:>5} dt={dt:g}: relative drag energy error {error:.3e},",
+                f"time per step (us) {step_time * 1e6:.1f}",
+            )
+    return results
@@ -0,0 +1,483 @@
+# module for finding candidate particle pairs before the collision checks
+import numpy as np
+from scipy.spatial import cKDTree
+from .species import SPECIES, NEUTRON, URANIUM
+
+
+def _pair_array(i, j):
+    """
+    Orders index pairs so that the first index is the smaller one
+
+    Parameters:
+        i (ndarray): First index of every pair
+        j (ndarray): Second index of every pair
+
+    Returns:
+        ndarray: M x 2 array of pairs with pairs[:, 0] < pairs[:, 1]
+    """
+    return np.stack((np.minimum(i, j), np.maximum(i, j)), axis=1).astype(np.int64)
+
+
+def _expand_ranges(starts, counts):
+    """
+    Concatenates the integer ranges [start, start + count) without a Python loop
+
+    Parameters:
+        starts (ndarray): First value of every range
+        counts (ndarray): Length of every range
+
+    Returns:
+        ndarray: All values of all ranges, range after range
+    """
+    total = int(np.sum(counts))
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+class Broadphase:
+    """
+    Base class for broadphase backends, which return every pair of particles that may be in contact
+
+    Attributes:
+        name (str): Name the backend is selected by
+    """
+
+    name = None
+
+    def candidatePairs(self, pos, cutoff):
+        """
+        Finds the pairs of particles that need a narrow-phase contact check
+
+        Parameters:
+            pos (ndarray): N x 3 array of particle positions(in m)
+            cutoff (float): Largest contact distance(in m) between any two particles
+
+        Returns:
+            ndarray: M x 2 array of index pairs (i < j), including every pair closer than cutoff
+        """
+        raise NotImplementedError
+
+
+class BruteForceBroadphase(Broadphase):
+    """
+    Broadphase returning every pair, used when most particles are within contact distance of each other
+    """
+
+    name = "brute"
+
+    def candidatePairs(self, pos, cutoff):
+        i, j = np.triu_indices(len(pos), k=1)
+        return np.stack((i, j), axis=1).astype(np.int64)
+
+
+class GridBroadphase(Broadphase):
+    """
+    Broadphase hashing particles into a uniform grid of cells one cutoff wide, then pairing neighbouring cells
+    """
+
+    name = "grid"
+
+    # Half of the 26 neighbouring cells, so each pair of cells is visited once
+    _HALF_SHELL = np.array(
+        [
+            (dx, dy, dz)
+            for dx in (-1, 0, 1)
+            for dy in (-1, 0, 1)
+            for dz in (-1, 0, 1)
+            if (dx, dy, dz) > (0, 0, 0)
+        ]
+    )
+
+    def candidatePairs(self, pos, cutoff):
+        if len(pos) < 2:
+            return np.empty((0, 2), dtype=np.int64)
+        cells = np.floor(pos / cutoff).astype(np.int64)
+        # pad by one cell on every side so neighbour keys never wrap around
+        cells -= cells.min(axis=0) - 1
+        dims = cells.max(axis=0) + 2
+        strides = np.array([dims[1] * dims[2], dims[2], 1])
+        keys = cells @ strides
+
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+
+        # pairs within the same cell
+        lo = np.searchsorted(sorted_keys, keys, side="left")
+        hi = np.searchsorted(sorted_keys, keys, side="right")
+        i_list = [np.repeat(np.arange(len(pos)), hi - lo)]
+        j_list = [order[_expand_ranges(lo, hi - lo)]]
+
+        # pairs with the neighbouring cells
+        for offset in self._HALF_SHELL:
+            neighbour_keys = keys + offset @ strides
+            lo = np.searchsorted(sorted_keys, neighbour_keys, side="left")
+            hi = np.searchsorted(sorted_keys, neighbour_keys, side="right")
+            i_list.append(np.repeat(np.arange(len(pos)), hi - lo))
+            j_list.append(order[_expand_ranges(lo, hi - lo)])
+
+        i = np.concatenate(i_list)
+        j = np.concatenate(j_list)
+        # same-cell pairs were found from both ends, and include self-pairs
+        same_cell = keys[i] == keys[j]
+        keep = ~same_cell | (i < j)
+        return _pair_array(i[keep], j[keep])
+
+
+class KDTreeBroadphase(Broadphase):
+    """
+    Broadphase using scipy's cKDTree, robust when particles are clustered
+    """
+
+    name = "kdtree"
+
+    def candidatePairs(self, pos, cutoff):
+        if len(pos) < 2:
+            return np.empty((0, 2), dtype=np.int64)
+        pairs = cKDTree(pos).query_pairs(r=cutoff, output_type="ndarray")
+        return pairs.astype(np.int64).reshape(-1, 2)
+
+
+class SweepBroadphase(Broadphase):
+    """
+    Broadphase sorting particles along x and sweeping over overlapping intervals, cheap for small populations
+    """
+
+    name = "sweep"
+
+    def candidatePairs(self, pos, cutoff):
+        if len(pos) < 2:
+            return np.empty((0, 2), dtype=np.int64)
+        order = np.argsort(pos[:, 0], kind="stable")
+        sorted_x = pos[order, 0]
+
+        # every particle after k in x order whose interval still overlaps
+        hi = np.searchsorted(sorted_x, sorted_x + cutoff, side="right")
+        counts = hi - np.arange(len(pos)) - 1
+        k = np.repeat(np.arange(len(pos)), counts)
+        m = _expand_ranges(np.arange(len(pos)) + 1, counts)
+
+        i = order[k]
+        j = order[m]
+        # cull with the y and z intervals as well
+        overlap = np.all(np.abs(pos[i, 1:] - pos[j, 1:]) <= cutoff, axis=1)
+        return _pair_array(i[overlap], j[overlap])
+
+
+BROADPHASES = {
+    backend.name: backend
+    for backend in (
+        BruteForceBroadphase,
+        GridBroadphase,
+        KDTreeBroadphase,
+        SweepBroadphase,
+    )
+}
+
+
+def select_broadphase(pos, cutoff):
+    """
+    Picks a broadphase backend from the particle density and the contact distance
+
+    Parameters:
+        pos (ndarray): N x 3 array of particle positions(in m)
+        cutoff (float): Largest contact distance(in m) between any two particles
+
+    Returns:
+        Broadphase: The backend expected to be cheapest for this configuration
+    """
+    num_particles = len(pos)
+    if num_particles < 2:
+        return BruteForceBroadphase()
+
+    # expected number of neighbours within cutoff, for particles spread over their bounding box
+    extent = np.ptp(pos, axis=0) + cutoff
+    density = num_particles / np.prod(extent)
+    neighbours = density * (4 / 3) * np.pi * cutoff**3
+
+    if neighbours >= 0.5 * num_particles:
+        return BruteForceBroadphase()
+    if num_particles <= 64:
+        return SweepBroadphase()
+    if neighbours <= 8:
+        return GridBroadphase()
+    return KDTreeBroadphase()
+
+
+def make_broadphase(broadphase):
+    """
+    Obtains a broadphase backend from its name
+
+    Parameters:
+        broadphase (str or Broadphase): "auto", "brute", "grid", "kdtree", "sweep" or a Broadphase object
+
+    Returns:
+        Broadphase or None: The backend, or None when it should be picked by select_broadphase every step
+    """
+    if isinstance(broadphase, Broadphase):
+        return broadphase
+    if broadphase == "auto":
+        return None
+    try:
+        return BROADPHASES[broadphase]()
+    except KeyError:
+        raise ValueError(f"Unknown broadphase: {broadphase}") from None
+
+
+class NeighborList:
+    """
+    A class keeping Verlet neighbor lists, candidate pairs built with an extra skin distance and reused across
+    time steps until some particle has moved more than half the skin
+
+    Attributes:
+        skin (float or None): Margin(in m) added to the cutoff, None to use skin_fraction of the cutoff
+        skin_fraction (float): Skin as a fraction of the cutoff when skin is None
+        builds (int): Number of times the list was rebuilt
+        reuses (int): Number of calls answered from the existing list
+    """
+
+    def __init__(self, skin=None, broadphase="auto", skin_fraction=0.1):
+        """
+        Initializes a NeighborList object
+
+        Parameters:
+            skin (float or None): Margin(in m) added to the cutoff, None to use skin_fraction of the cutoff
+            broadphase (str or Broadphase): Backend used to build the list, see make_broadphase
+            skin_fraction (float): Skin as a fraction of the cutoff when skin is None
+        """
+        self.skin = skin
+        self.skin_fraction = skin_fraction
+        self.broadphase = make_broadphase(broadphase)
+        self.builds = 0
+        self.reuses = 0
+        self._pairs = None
+        self._ref_pos = None
+        self._cutoff = None
+        self._skin = None
+        self._version = None
+
+    def _needsRebuild(self, pos, cutoff, version):
+        """
+        Checks whether the stored list can still answer a call
+
+        Parameters:
+            pos (ndarray): N x 3 array of particle positions(in m)
+            cutoff (float): Largest contact distance(in m) between any two particles
+            version (int): Version of the particle store, changes when particles are added or removed
+
+        Returns:
+            bool: True when the list has to be rebuilt
+        """
+        if self._pairs is None or version != self._version or cutoff > self._cutoff:
+            return True
+        if len(pos) == 0:
+            return False
+        displacement = np.max(np.sum((pos - self._ref_pos) ** 2, axis=1))
+        return displacement > (0.5 * self._skin) ** 2
+
+    def candidatePairs(self, pos, cutoff, version=None, species=None):
+        """
+        Obtains the pairs of particles that need a narrow-phase contact check, rebuilding the list when needed
+
+        Parameters:
+            pos (ndarray): N x 3 array of particle positions(in m)
+            cutoff (float): Largest contact distance(in m) between any two particles
+            version (int): Version of the particle store, changes when particles are added or removed
+            species (ndarray): N array of particle species ids, when given neutron-uranium pairs are left out of
+                the list, as a FissionIndex finds those contacts, None to keep every pair
+
+        Returns:
+            ndarray: M x 2 array of index pairs (i < j) sorted by i then j, including every pair closer than cutoff
+        """
+        if not self._needsRebuild(pos, cutoff, version):
+            self.reuses += 1
+            return self._pairs
+
+        skin = self.skin if self.skin is not None else self.skin_fraction * cutoff
+        phase = self.broadphase
+        if phase is None:
+            phase = select_broadphase(pos, cutoff + skin)
+        pairs = phase.candidatePairs(pos, cutoff + skin)
+        if species is not None:
+            # species only change with the version, so the pairs left out stay out until the next build
+            pair_species = species[pairs]
+            is_fission_pair = (pair_species[:, 0] != pair_species[:, 1]) & np.all(
+                (pair_species == NEUTRON) | (pair_species == URANIUM), axis=1
+            )
+            pairs = pairs[~is_fission_pair]
+
+        self._pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+        self._ref_pos = pos.copy()
+        self._cutoff = cutoff
+        self._skin = skin
+        self._version = version
+        self.builds += 1
+        return self._pairs
+
+
+class FissionIndex:
+    """
+    A class indexing uranium positions in a cKDTree that neutrons query for fission contacts, kept apart from
+    the general collision pairs. The tree is only rebuilt once some uranium atom has moved further than the
+    bound since it was built. Tree entries keep the stable ids of their atoms, so adding and removing particles
+    only looks the atoms up again with rowsOf, uranium removed by fission staying in the tree and being skipped,
+    and the tree is rebuilt then only when uranium atoms it does not hold were added.
+
+    Attributes:
+        bound (float or None): Uranium displacement(in m) allowed before rebuilding, None to use bound_fraction
+        bound_fraction (float): Bound as a fraction of the neutron-uranium contact distance when bound is None
+        builds (int): Number of times the tree was rebuilt
+        reuses (int): Number of queries answered from the existing tree
+    """
+
+    def __init__(self, bound=None, bound_fraction=0.1):
+        """
+        Initializes a FissionIndex object
+
+        Parameters:
+            bound (float or None): Uranium displacement(in m) allowed before rebuilding, None to use bound_fraction
+            bound_fraction (float): Bound as a fraction of the neutron-uranium contact distance when bound is None
+        """
+        self.contact = SPECIES.contact_radius[NEUTRON] + SPECIES.contact_radius[URANIUM]
+        self.bound = bound if bound is not None else bound_fraction * self.contact
+        self.builds = 0
+        self.reuses = 0
+        self._tree = None
+        self._store = None
+        self._ids = None
+        self._uranium = None
+        self._live = None
+        self._live_rows = None
+        self._live_ref = None
+        self._ref_pos = None
+        self._version = None
+
+    def _build(self, store, pos):
+        """
+        Rebuilds the tree from the current uranium positions
+
+        Parameters:
+            store (ParticleStore): The store holding the particles
+            pos (ndarray): N x 3 array of particle positions(in m)
+
+        Returns:
+            None
+        """
+        self._uranium = np.flatnonzero(store.species == URANIUM)
+        self._ids = store.ids[self._uranium]
+        self._live = np.ones(len(self._uranium), dtype=bool)
+        self._ref_pos = pos[self._uranium].copy()
+        self._live_rows = self._uranium
+        self._live_ref = self._ref_pos
+        self._tree = cKDTree(self._ref_pos) if len(self._uranium) > 0 else None
+        self._store = store
+        self._version = store.version
+        self.builds += 1
+
+    def _follow(self, store):
+        """
+        Finds the rows of the atoms of the tree again after particles were added or removed
+
+        Parameters:
+            store (ParticleStore): The store holding the particles
+
+        Returns:
+            bool: Whether the tree still holds every uranium atom of the store
+        """
+        self._uranium = store.rowsOf(self._ids)
+        self._live = self._uranium >= 0
+        self._live_rows = self._uranium[self._live]
+        self._live_ref = self._ref_pos[self._live]
+        self._version = store.version
+        return len(self._live_rows) == store.count(URANIUM)
+
+    def contactPairs(self, store, pos=None):
+        """
+        Finds every neutron-uranium pair within contact distance
+
+        Parameters:
+            store (ParticleStore): The store holding the particles
+            pos (ndarray): N x 3 array of positions(in m) to test instead of store.pos
+
+        Returns:
+            ndarray: K array with the store row of the neutron of each pair
+            ndarray: K array with the store row of the uranium of each pair
+            ndarray: K array with the distance(in m) between the particles of each pair
+        """
+        if pos is None:
+            pos = store.pos
+        rebuild = self._tree is None or store is not self._store
+        if not rebuild and store.version != self._version:
+            rebuild = not self._follow(store)
+        if not rebuild:
+            displacement = np.sum((pos[self._live_rows] - self._live_ref) ** 2, axis=1)
+            rebuild = np.max(displacement, initial=0.0) > self.bound**2
+        if rebuild:
+            self._build(store, pos)
+        else:
+            self.reuses += 1
+
+        neutrons = np.flatnonzero(store.species == NEUTRON)
+        if self._tree is None or len(neutrons) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0)
+
+        # every uranium within contact distance now was within contact + bound when the tree was built
+        hits = self._tree.query_ball_point(pos[neutrons], r=self.contact + self.bound)
+        counts = np.fromiter((len(hit) for hit in hits), dtype=np.int64, count=len(hits))
+        entries = np.concatenate(hits).astype(np.int64)
+        live = self._live[entries]
+        neutron_rows = np.repeat(neutrons, counts)[live]
+        uranium_rows = self._uranium[entries[live]]
+
+        dist = np.linalg.norm(pos[neutron_rows] - pos[uranium_rows], axis=1)
+        touching = dist <= self.contact
+        return neutron_rows[touching], uranium_rows[touching], dist[touching]
+
+
+def contact_pairs(pos, species, pairs):
+    """
+    Narrow phase keeping the candidate pairs that are within contact distance
+
+    Parameters:
+        pos (ndarray): N x 3 array of particle positions(in m)
+        species (ndarray): N array of particle species ids
+        pairs (ndarray): M x 2 array of candidate index pairs
+
+    Returns:
+        ndarray: K x 2 array of pairs in contact, in the order they were given
+        ndarray: K array with the distance(in m) between the particles of each pair
+    """
+    dist = np.linalg.norm(pos[pairs[:, 0]] - pos[pairs[:, 1]], axis=1)
+    contact_radius = SPECIES.contact_radius[species]
+    min_dist = contact_radius[pairs[:, 0]] + contact_radius[pairs[:, 1]]
+    touching = dist <= min_dist
+    return pairs[touching], dist[touching]
+
+
+def neutron_pairs(pos, species, cutoff):
+    """
+    Finds the candidate pairs of a neutron with any particle but uranium, for steps on which only neutrons have
+    moved. Neutron-uranium contacts are left to the FissionIndex.
+
+    Parameters:
+        pos (ndarray): N x 3 array of particle positions(in m)
+        species (ndarray): N array of particle species ids
+        cutoff (float): Largest contact distance(in m) between a neutron and any other particle
+
+    Returns:
+        ndarray: M x 2 array of index pairs (i < j) sorted by i then j, including every such pair closer than
+            cutoff
+    """
+    neutrons = np.flatnonzero(species == NEUTRON)
+    others = np.flatnonzero(species != URANIUM)
+    if len(neutrons) == 0 or len(others) < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    hits = cKDTree(pos[others]).query_ball_point(pos[neutrons], r=cutoff)
+    counts = np.fromiter((len(hit) for hit in hits), dtype=np.int64, count=len(hits))
+    i = np.repeat(neutrons, counts)
+    j = others[np.concatenate(hits).astype(np.int64)]
+
+    # neutron-neutron pairs are found from both ends, keep them once
+    keep = (species[j] != NEUTRON) | (i < j)
+    pairs = _pair_array(i[keep], j[keep])
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
@@ -0,0 +1,197 @@
+# module for a persistent cache of simulation results, shared by every sweep that runs the same simulations
+import hashlib
+import json
+import numpy as np
+import sqlite3
+import time
+from .manifest import _plain
+
+# Version of the simulation results, to be raised by every change that alters what a seeded run gives, so
+# results cached before the change are never taken for new ones
+ENGINE_VERSION = 3
+
+
+def point_key(point):
+    """
+    Turns the parameters of a simulation into integers identifying them, the same for equal parameters whatever
+    their numeric types
+
+    Parameters:
+        point (tuple): (num_neutrons, num_uranium, box_dim, dt) of the simulation
+
+    Returns:
+        tuple: Four 32 bit integers taken from a hash of the parameters
+    """
+    digest = hashlib.sha256(json.dumps([float(value) for value in point]).encode()).digest()
+    return tuple(int(word) for word in np.frombuffer(digest[:16], dtype="<u4"))
+
+
+class ResultCache:
+    """
+    A class storing the summaries of finished simulations in an SQLite file, content addressed: the key of a
+    summary is a hash of the parameters, the options and the seed of its simulation and of ENGINE_VERSION, so
+    a seeded simulation already run by any sweep is read back instead of run again. The file is kept under
+    max_bytes of summaries by evicting the least recently used ones.
+
+    Writes are committed at most every commit_interval seconds and when the cache is closed, a cache losing its
+    last writes only costs simulations to run again.
+
+    Attributes:
+        path (str): Path of the cache file
+        max_bytes (int): Largest total size(in bytes) of the stored summaries
+        hits (int): Number of summaries found in the cache
+        misses (int): Number of summaries looked for and not found
+        stores (int): Number of summaries added
+        evictions (int): Number of summaries evicted to keep under max_bytes
+    """
+
+    def __init__(self, path, max_bytes=256 * 2**20, commit_interval=1.0):
+        """
+        Initializes a ResultCache object, creating the cache file when missing
+
+        Parameters:
+            path (str): Path of the cache file
+            max_bytes (int): Largest total size(in bytes) of the stored summaries
+            commit_interval (float): Longest time(in s) between a write and its commit
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.commit_interval = commit_interval
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results"
+            "(key TEXT PRIMARY KEY, summary TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results(last_used)")
+        self._connection.commit()
+        self._size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        self._last_commit = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    @staticmethod
+    def key(point, seed, options=None):
+        """
+        Builds the key of the summary of a simulation
+
+        Parameters:
+            point (tuple): (num_neutrons, num_uranium, box_dim, dt) of the simulation
+            seed (SeedSequence): Seed of the simulation
+            options (dict): Options the simulation was run with
+
+        Returns:
+            str: Hexadecimal SHA-256 hash identifying the simulation
+        """
+        content = {
+            "point": [float(value) for value in point],
+            "options": {} if options is None else options,
+            "entropy": str(seed.entropy),
+            "spawn_key": list(seed.spawn_key),
+            "version": ENGINE_VERSION,
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=_plain).encode()).hexdigest()
+
+    def _commitSoon(self):
+        """
+        Commits the writes so far when the last commit is old enough
+
+        Returns:
+            None
+        """
+        if time.time() - self._last_commit >= self.commit_interval:
+            self._connection.commit()
+            self._last_commit = time.time()
+
+    def get(self, key):
+        """
+        Obtains a stored summary, marking it as the most recently used
+
+        Parameters:
+            key (str): Key of the summary, from key
+
+        Returns:
+            dict: The summary, None when the cache does not hold it
+        """
+        row = self._connection.execute("SELECT summary FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._connection.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._commitSoon()
+        return json.loads(row[0])
+
+    def put(self, key, summary):
+        """
+        Stores a summary, then evicts the least recently used summaries while the cache is over max_bytes
+
+        Parameters:
+            key (str): Key of the summary, from key
+            summary (dict): Summary of the simulation, with values json or numpy can write
+
+        Returns:
+            None
+        """
+        text = json.dumps(summary, default=_plain)
+        old = self._connection.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+        if old is not None:
+            self._size -= old[0]
+        self._connection.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, text, len(text), time.time())
+        )
+        self._size += len(text)
+        self.stores += 1
+
+        while self._size > self.max_bytes:
+            key, size = self._connection.execute(
+                "SELECT key, size FROM results ORDER BY last_used LIMIT 1"
+            ).fetchone()
+            self._connection.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._size -= size
+            self.evictions += 1
+        self._commitSoon()
+
+    def report(self):
+        """
+        Summarizes how much the cache was used since it was opened
+
+        Returns:
+            dict: The hits, misses, stores and evictions, the hit_rate among the look-ups, and the number of
+                entries and bytes held
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "entries": len(self),
+            "bytes": self._size,
+        }
+
+    def close(self):
+        """
+        Commits the last writes and closes the cache file
+
+        Returns:
+            None
+        """
+        if self._connection is not None:
+            self._connection.commit()
+            self._connection.close()
+            self._connection = None
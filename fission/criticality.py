@@ -0,0 +1,234 @@
+# module for k-eigenvalue (criticality) calculations, following neutrons one generation at a time
+import numpy as np
+from scipy import stats
+from .kernels import dragFlight
+from .reaction import FISSION_PRODUCTS, FISSION_PRODUCT_SPEEDS
+from .simulation import generate_store, num_input
+from .species import SPECIES, NEUTRON, URANIUM
+from .transport import foldTracks, gridCells
+
+# Neutrons released by one fission and the speed scale of their velocity components(in m/s)
+NEUTRONS_PER_FISSION = int(np.count_nonzero(FISSION_PRODUCTS == NEUTRON))
+NEUTRON_SPEED = float(FISSION_PRODUCT_SPEEDS[FISSION_PRODUCTS == NEUTRON][0])
+
+
+class KEigenvalue:
+    """
+    A class estimating the effective multiplication factor k of a uranium loading, the number of neutrons one
+    generation of fission neutrons gives rise to divided by the size of that generation. Uranium atoms are held
+    in place and never used up, so every generation sees the same configuration.
+
+    Every generation starts source_size neutrons at fission sites drawn from the source bank, the sites of the
+    previous generation, with the velocities fissionBatch gives fission neutrons. Neutrons are tracked with the
+    same delta tracking as TrackLengthTransport until they undergo fission, which adds their position to the
+    next bank, or until census_time runs out. The box walls reflect neutrons, so the census is what lets
+    neutrons escape: k measures the multiplication within census_time of a neutron's birth.
+
+    The first generations are inactive while the bank settles from its initial guess, the others are averaged.
+    The cost is bounded by source_size neutrons times the number of generations, whatever the loading.
+
+    Attributes:
+        box_dim (float): Half of the length of one side of the cubic box
+        source_size (int): Number of source neutrons started every generation
+        census_time (float): Time(in s) a neutron is followed for before it counts as lost
+        cells (int): Number of grid cells along each axis
+        bank (ndarray): M x 3 array with the fission sites(in m) the next generation starts from
+        k_history (list): k of every generation run so far, inactive ones included
+        num_virtual (int): Number of tentative collisions rejected by delta tracking
+    """
+
+    def __init__(
+        self, uranium_pos, source_pos, box_dim, source_size=1000, census_time=0.001, cells=None, rng=np.random
+    ):
+        """
+        Initializes a KEigenvalue object
+
+        Parameters:
+            uranium_pos (ndarray): K x 3 array with the position(in m) of every uranium atom
+            source_pos (ndarray): M x 3 array with the positions(in m) of the first generation's source
+            box_dim (float): Half of the length of one side of the cubic box
+            source_size (int): Number of source neutrons started every generation
+            census_time (float): Time(in s) a neutron is followed for before it counts as lost
+            cells (int): Number of grid cells along each axis, defaults as in TrackLengthTransport
+            rng (Generator): Random number generator, defaults to numpy's global one
+        """
+        contact = SPECIES.contact_radius
+        if cells is None:
+            cells = int(np.clip(2 * box_dim / (contact[NEUTRON] + contact[URANIUM]), 1, 32))
+        self.box_dim = box_dim
+        self.source_size = source_size
+        self.census_time = census_time
+        self.cells = cells
+        self.rng = rng
+        self.bank = np.asarray(source_pos, dtype=float).reshape(-1, 3)
+        self.k_history = []
+        self.num_virtual = 0
+
+        # macroscopic cross-section of every cell, as in TrackLengthTransport
+        cross_section = np.pi * (contact[NEUTRON] + contact[URANIUM]) ** 2
+        cell_volume = (2 * box_dim / cells) ** 3
+        uranium_cells = gridCells(np.asarray(uranium_pos, dtype=float).reshape(-1, 3), box_dim, cells)
+        self._sigma = np.bincount(uranium_cells, minlength=cells**3) * cross_section / cell_volume
+
+    def _track(self, pos, vel):
+        """
+        Follows a generation of neutrons until each undergoes fission or reaches the census
+
+        Parameters:
+            pos (ndarray): N x 3 array of starting positions(in m), updated in place
+            vel (ndarray): N x 3 array of starting velocities(in m/s), updated in place
+
+        Returns:
+            ndarray: F x 3 array with the fission sites(in m) of the generation
+        """
+        majorant = self._sigma.max()
+        time = np.zeros(len(pos))
+        active = np.flatnonzero(np.einsum("ij,ij->i", vel, vel) > 0)
+        k = SPECIES.drag_prefactor[NEUTRON]
+        sites = []
+        while majorant > 0 and len(active) > 0:
+            distance = -np.log1p(-self.rng.uniform(0, 1, len(active))) / majorant
+            speed = np.linalg.norm(vel[active], axis=1)
+            flight_time = np.expm1(k * distance) / (k * speed)
+
+            # neutrons whose next collision comes after the census are lost
+            before_census = time[active] + flight_time <= self.census_time
+            active = active[before_census]
+            flight_time = flight_time[before_census]
+            time[active] += flight_time
+
+            active_pos = pos[active]
+            active_vel = vel[active]
+            dragFlight(active_pos, active_vel, np.full(len(active), NEUTRON), flight_time)
+            foldTracks(active_pos, active_vel, self.box_dim)
+            pos[active] = active_pos
+            vel[active] = active_vel
+
+            sigma = self._sigma[gridCells(active_pos, self.box_dim, self.cells)]
+            real = self.rng.uniform(0, 1, len(active)) * majorant < sigma
+            self.num_virtual += int(np.count_nonzero(~real))
+            sites.append(active_pos[real])
+            active = active[~real]
+
+        return np.concatenate(sites) if sites else np.empty((0, 3))
+
+    def generation(self):
+        """
+        Runs one generation from the source bank and replaces the bank with its fission sites
+
+        Returns:
+            float: k of the generation, the fission neutrons produced per source neutron
+        """
+        if len(self.bank) == 0:
+            # the chain died out, no later generation has any neutron
+            self.k_history.append(0.0)
+            return 0.0
+
+        # Resample a fixed number of source neutrons from the bank, whatever its size
+        draws = (self.rng.uniform(0, 1, self.source_size) * len(self.bank)).astype(np.int64)
+        pos = self.bank[np.minimum(draws, len(self.bank) - 1)]
+        vel = self.rng.uniform(-1, 1, (self.source_size, 3)) * NEUTRON_SPEED
+
+        self.bank = self._track(pos, vel)
+        k = NEUTRONS_PER_FISSION * len(self.bank) / self.source_size
+        self.k_history.append(k)
+        return k
+
+    def estimate(self, inactive, confidence=0.95):
+        """
+        Averages k over the active generations run so far
+
+        Parameters:
+            inactive (int): Number of first generations left out of the average
+            confidence (float): Confidence level of the interval
+
+        Returns:
+            float: Mean k of the active generations, nan when there are none
+            float: Half width of the confidence interval of the mean, nan with fewer than two active generations
+        """
+        active = np.asarray(self.k_history[inactive:])
+        if len(active) == 0:
+            return np.nan, np.nan
+        if len(active) == 1:
+            return float(active[0]), np.nan
+        std_error = np.std(active, ddof=1) / np.sqrt(len(active))
+        return float(active.mean()), float(stats.t.ppf(0.5 + confidence / 2, len(active) - 1) * std_error)
+
+    def run(self, generations, inactive, verbose=False):
+        """
+        Runs a number of generations
+
+        Parameters:
+            generations (int): Total number of generations, inactive ones included
+            inactive (int): Number of first generations left out of the average
+            verbose (bool): Whether to print k and the running estimate after every generation
+
+        Returns:
+            float: Mean k of the active generations
+            float: Half width of the 95% confidence interval of the mean
+        """
+        for num in range(len(self.k_history), generations):
+            k = self.generation()
+            if verbose:
+                k_mean, half_width = self.estimate(inactive)
+                status = "inactive" if num < inactive else f"k_eff = {k_mean:.5f} +/- {half_width:.5f}"
+                print(f"Generation {num + 1}: k = {k:.5f}, {status}")
+        return self.estimate(inactive)
+
+
+def k_effective(
+    num_neutrons,
+    num_uranium,
+    box_dim,
+    generations=50,
+    inactive=10,
+    source_size=1000,
+    census_time=0.001,
+    verbose=False,
+):
+    """
+    Estimates the effective multiplication factor of a box loaded as in run_simulation
+
+    Parameters:
+        num_neutrons (int): The number of neutrons generated within box, the first guess of the source
+        num_uranium (int): The number of uranium atoms generated within box
+        box_dim (float): Half of the length of one side of the cubic box
+        generations (int): Total number of generations, inactive ones included
+        inactive (int): Number of first generations left out of the average
+        source_size (int): Number of source neutrons started every generation
+        census_time (float): Time(in s) a neutron is followed for before it counts as lost
+        verbose (bool): Whether to print k and the running estimate after every generation
+
+    Returns:
+        float: Mean k of the active generations
+        float: Half width of the 95% confidence interval of the mean
+        KEigenvalue: The object that ran the generations, holding k_history
+    """
+    store = generate_store(num_neutrons, num_uranium, box_dim)
+    uranium_pos = store.pos[store.species == URANIUM]
+    source_pos = store.pos[store.species == NEUTRON]
+    solver = KEigenvalue(uranium_pos, source_pos, box_dim, source_size, census_time)
+    k_mean, half_width = solver.run(generations, inactive, verbose)
+    return k_mean, half_width, solver
+
+
+def main():
+    """
+    Executes logic for one criticality calculation, with user inputted initial values and to be executed by
+    'k_eff'
+
+    Returns:
+        None
+    Outputs:
+        Displays k of every generation and the running k-effective with its 95% confidence interval
+    """
+    num_neutrons = int(num_input("Please enter how many neutrons to generate within the box\n>"))
+    num_uranium = int(num_input("Please enter how many uraniums to generate within the box\n>"))
+    box_dim = num_input("Please enter a value for half the length of the box\n>")
+    census_time = num_input("Please enter the time a neutron is followed for in each generation\n>")
+
+    k_mean, half_width, solver = k_effective(
+        num_neutrons, num_uranium, box_dim, census_time=census_time, verbose=True
+    )
+    print("k-effective:", k_mean, "+/-", half_width)
+    print("Rejected collisions:", solver.num_virtual)
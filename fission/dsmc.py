@@ -0,0 +1,108 @@
+# module for stochastic (DSMC) collisions among uranium, barium and krypton atoms
+import numpy as np
+from .species import SPECIES, NEUTRON
+
+
+class DSMCCollisions:
+    """
+    A class choosing the collisions among heavy atoms(every species but neutrons) with Direct Simulation Monte
+    Carlo instead of checking the distance of every pair. Heavy atoms are binned into cubic cells. In a cell
+    holding N atoms, Bird's no-time-counter scheme draws 0.5 * N * (N - 1) * (sigma * g)_max * dt / V random
+    candidate pairs, V being the volume of the cell inside the box, and a candidate with relative speed g and
+    cross-section sigma = pi * d^2 collides with probability sigma * g / (sigma * g)_max, d being the contact
+    distance of Particle.collideParticle. This gives every pair its collision rate in O(N) work.
+
+    The chosen pairs are resolved with the existing rules, see elasticCollisionBatch. Neutrons are left to the
+    contact checks, so fission keeps its own path.
+
+    Attributes:
+        cell_size (float or None): Length(in m) of a cell side, None for the largest heavy contact distance
+        max_rate (float): Largest sigma * g(in m^3/s) seen so far, raised whenever a candidate exceeds it
+        candidates (int): Number of candidate pairs drawn so far
+        collisions (int): Number of candidate pairs accepted so far
+    """
+
+    def __init__(self, cell_size=None):
+        """
+        Initializes a DSMCCollisions object
+
+        Parameters:
+            cell_size (float or None): Length(in m) of a cell side, None for the largest heavy contact distance
+        """
+        self.cell_size = cell_size
+        self.max_rate = 0.0
+        self.candidates = 0
+        self.collisions = 0
+
+    def collisionPairs(self, store, dt, box_dim, rng=np.random):
+        """
+        Draws the heavy-atom pairs colliding during a time step
+
+        Parameters:
+            store (ParticleStore): The store holding the particles
+            dt (float): The time(in s) the heavy atoms moved by since the last draw
+            box_dim (float): Half of the length of one side of the cubic box
+            rng (Generator): Random number generator, defaults to numpy's global one
+
+        Returns:
+            ndarray: K x 2 array of colliding pairs, a particle may appear in several of them
+            ndarray: K array with the distance(in m) between the particles of each pair
+        """
+        species = store.species
+        heavy = np.flatnonzero(species != NEUTRON)
+        empty = np.empty((0, 2), dtype=np.int64), np.empty(0)
+        if len(heavy) < 2:
+            return empty
+
+        contact = SPECIES.contact_radius
+        heavy_species = np.flatnonzero(SPECIES.count(species[heavy]) > 0)
+        cell_size = self.cell_size or 2 * contact[heavy_species].max()
+        if self.max_rate == 0.0:
+            # first guess from the largest cross-section and twice the largest speed, refined as pairs come in
+            speed = np.sqrt(np.einsum("ij,ij->i", store.vel[heavy], store.vel[heavy]))
+            self.max_rate = np.pi * (2 * contact[heavy_species].max()) ** 2 * 2 * speed.max()
+        if self.max_rate == 0.0:
+            return empty
+
+        # Sort the heavy atoms by cell
+        cells_per_side = max(int(np.ceil(2 * box_dim / cell_size)), 1)
+        index = np.clip(((store.pos[heavy] + box_dim) // cell_size).astype(np.int64), 0, cells_per_side - 1)
+        cell = (index[:, 0] * cells_per_side + index[:, 1]) * cells_per_side + index[:, 2]
+        order = np.argsort(cell, kind="stable")
+        heavy = heavy[order]
+        occupied, starts, counts = np.unique(cell[order], return_index=True, return_counts=True)
+
+        # Volume of every occupied cell inside the box, the cells of the last layer along an axis being clipped
+        # by the wall whenever the box side is not a whole number of cells
+        cell_index = np.stack(np.unravel_index(occupied, (cells_per_side,) * 3), axis=1)
+        width = np.minimum((cell_index + 1) * cell_size, 2 * box_dim) - cell_index * cell_size
+        volume = np.prod(width, axis=1)
+
+        # Number of candidates of every cell, rounded up or down at random to keep the right mean
+        expected = 0.5 * counts * (counts - 1) * self.max_rate * dt / volume
+        num_candidates = np.floor(expected + rng.uniform(0, 1, len(expected))).astype(np.int64)
+        if num_candidates.sum() == 0:
+            return empty
+        cell_start = np.repeat(starts, num_candidates)
+        cell_count = np.repeat(counts, num_candidates)
+
+        # Two different atoms of the cell for every candidate
+        draws = rng.uniform(0, 1, (len(cell_start), 2))
+        first = np.minimum((draws[:, 0] * cell_count).astype(np.int64), cell_count - 1)
+        second = np.minimum((draws[:, 1] * (cell_count - 1)).astype(np.int64), cell_count - 2)
+        second += second >= first
+        i = heavy[cell_start + first]
+        j = heavy[cell_start + second]
+
+        # Accept with probability sigma * g / (sigma * g)_max
+        sigma = np.pi * (contact[species[i]] + contact[species[j]]) ** 2
+        relative_speed = np.linalg.norm(store.vel[i] - store.vel[j], axis=1)
+        rate = sigma * relative_speed
+        accepted = rng.uniform(0, 1, len(rate)) * self.max_rate < rate
+        self.max_rate = max(self.max_rate, float(rate.max()))
+        self.candidates += len(rate)
+        self.collisions += int(np.count_nonzero(accepted))
+
+        pairs = np.stack((np.minimum(i, j), np.maximum(i, j)), axis=1)[accepted]
+        dist = np.linalg.norm(store.pos[pairs[:, 0]] - store.pos[pairs[:, 1]], axis=1)
+        return pairs, dist
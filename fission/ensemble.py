@@ -0,0 +1,226 @@
+# module for running many independent simulations over a pool of processes
+import numpy as np
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .cache import point_key
+from .manifest import root_seed
+from .simulation import run_simulation
+
+
+def point_seed(root, point, *numbers):
+    """
+    Derives the seed of a simulation from the root seed of a sweep and the content of the simulation, its
+    parameters and numbers telling apart the simulations of one point, rather than from its position in the
+    sweep, so every sweep with the same root seed gives a simulation the same seed and can reuse its result
+
+    Parameters:
+        root (SeedSequence): Root seed of the sweep
+        point (tuple): (num_neutrons, num_uranium, box_dim, dt) of the simulation
+        *numbers (int): Numbers identifying the simulation among those of its point
+
+    Returns:
+        SeedSequence: The seed of the simulation
+    """
+    return np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + point_key(point) + numbers)
+
+
+def replica_seeds(seed, points, replicas):
+    """
+    Derives an independent seed for every replica of every point of a sweep with point_seed, so the seed of a
+    replica only depends on the root seed, its point and its replica number, however the work is shared out and
+    whichever sweep runs it. A point repeated in the sweep carries on numbering its replicas where its previous
+    occurrence stopped, so every occurrence gets replicas of its own.
+
+    Parameters:
+        seed (int, SeedSequence or None): Root seed of the sweep, None for fresh entropy from the system
+        points (list): (num_neutrons, num_uranium, box_dim, dt) tuples of the sweep
+        replicas (int or list): Number of replicas of every point, or one number per point
+
+    Returns:
+        list: One list per point of the (replica, SeedSequence) of each of its replicas
+    """
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    if np.ndim(replicas) == 0:
+        replicas = [replicas] * len(points)
+
+    seeds = []
+    first_replica = {}
+    for point, count in zip(points, replicas):
+        key = point_key(point)
+        first = first_replica.get(key, 0)
+        first_replica[key] = first + count
+        seeds.append([(replica, point_seed(root, point, replica)) for replica in range(first, first + count)])
+    return seeds
+
+
+def run_replica(point, seed, options):
+    """
+    Runs one simulation and keeps a summary of it, the work done by every process of the pool
+
+    Parameters:
+        point (tuple): (num_neutrons, num_uranium, box_dim, dt) of the simulation
+        seed (SeedSequence): Seed of the simulation
+        options (dict): Options passed on to run_simulation
+
+    Returns:
+        dict: The temp_change, the total_time(in s) taken by the run and the counters run_simulation puts in stats
+    """
+    stats = {}
+    particles, temp_change, total_time = run_simulation(*point, stats=stats, seed=seed, **options)
+    stats["temp_change"] = temp_change
+    stats["total_time"] = total_time
+    return stats
+
+
+def _run_chunk(chunk):
+    """
+    Runs a chunk of (index, point, seed, options) tasks one after the other, the work sent to one process
+
+    Parameters:
+        chunk (list): Tasks to run
+
+    Returns:
+        list: (index, summary) of every task, summary being the dictionary returned by run_replica
+        float: Time(in s) the chunk kept its process busy
+    """
+    start_time = time.time()
+    results = [(index, run_replica(point, seed, options)) for index, point, seed, options in chunk]
+    return results, time.time() - start_time
+
+
+def _finished_chunks(tasks, jobs):
+    """
+    Runs tasks over a pool of processes and yields the chunks of results as they come back
+
+    Parameters:
+        tasks (list): (index, point, seed, options) tasks to run
+        jobs (int): Number of processes, 1 to run every task in this process
+
+    Returns:
+        generator: The (results, chunk_time) of every chunk returned by _run_chunk, in the order they finish
+    """
+    if jobs == 1:
+        for task in tasks:
+            yield _run_chunk([task])
+        return
+
+    # small simulations are sent in chunks, so the pool is not slowed down by passing them one by one
+    chunksize = max(1, len(tasks) // (4 * jobs))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(_run_chunk, tasks[start : start + chunksize])
+            for start in range(0, len(tasks), chunksize)
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def sweep_tasks(points, replicas, seed, manifest=None, cache=None, options=None):
+    """
+    Lists the work items of a sweep, one per replica of every point, with the results of those a manifest or a
+    result cache already holds. Results found in the cache only are recorded in the manifest as well.
+
+    Parameters:
+        points (list): (num_neutrons, num_uranium, box_dim, dt) tuples to simulate
+        replicas (int or list): Number of runs of every point, or one number per point
+        seed (int, SeedSequence or None): Root seed of the sweep, None for fresh entropy from the system, or the
+            seed stored in the manifest
+        manifest (SweepManifest): Manifest of the finished items, None to run every item
+        cache (ResultCache): Cache of the results of earlier simulations, None to run every item not in the
+            manifest
+        options (dict): Options passed on to run_simulation, which tell cached results apart
+
+    Returns:
+        list: (point, replica, seed) of every work item, point by point
+        list: The recorded result of every work item, None for the items left to run
+        list: Number of work items of every point
+    """
+    seeds = replica_seeds(root_seed(seed, manifest), points, replicas)
+    tasks = [
+        (tuple(point), replica, replica_seed)
+        for point, point_seeds in zip(points, seeds)
+        for replica, replica_seed in point_seeds
+    ]
+    results = [None if manifest is None else manifest.get(*task) for task in tasks]
+    if cache is not None:
+        for index, task in enumerate(tasks):
+            if results[index] is None:
+                results[index] = cache.get(cache.key(task[0], task[2], options))
+                if results[index] is not None and manifest is not None:
+                    manifest.record(*task, results[index])
+    return tasks, results, [len(point_seeds) for point_seeds in seeds]
+
+
+def record_result(task, summary, manifest=None, cache=None, options=None):
+    """
+    Keeps the result of a work item that has just run in the manifest and the result cache of its sweep
+
+    Parameters:
+        task (tuple): (point, replica, seed) of the work item
+        summary (dict): Result of the work item, from run_replica
+        manifest (SweepManifest): Manifest of the finished items, None for a sweep without one
+        cache (ResultCache): Cache of the results of earlier simulations, None for a sweep without one
+        options (dict): Options the work item was run with
+
+    Returns:
+        None
+    """
+    if manifest is not None:
+        manifest.record(*task, summary)
+    if cache is not None:
+        cache.put(cache.key(task[0], task[2], options), summary)
+
+
+def group_results(results, counts):
+    """
+    Splits the results of every work item of a sweep into one list per point
+
+    Parameters:
+        results (list): Result of every work item, point by point
+        counts (list): Number of work items of every point
+
+    Returns:
+        list: One list per point of the results of its work items
+    """
+    grouped = []
+    start = 0
+    for count in counts:
+        grouped.append(results[start : start + count])
+        start += count
+    return grouped
+
+
+def run_ensemble(points, replicas=1, seed=None, jobs=1, manifest=None, cache=None, **options):
+    """
+    Runs every replica of every point of a sweep, spread over a pool of processes. Every replica has its own
+    random number generator seeded by replica_seeds, so a sweep with a given seed gives the same results
+    whatever the number of processes, and results come back in the order of the points and replicas.
+
+    With a manifest, replicas it records as finished are not run again, and every replica run is recorded as
+    soon as its chunk comes back, so an interrupted sweep started again with the same manifest carries on. With
+    a result cache, replicas already run by any sweep with the same root seed are taken from the cache, and
+    every replica run is added to it.
+
+    Parameters:
+        points (list): (num_neutrons, num_uranium, box_dim, dt) tuples to simulate
+        replicas (int or list): Number of runs of every point, or one number per point
+        seed (int, SeedSequence or None): Root seed of the sweep, None for fresh entropy from the system
+        jobs (int): Number of processes, 1 to run everything in this process
+        manifest (SweepManifest): Manifest recording the finished replicas, None to keep results in memory only
+        cache (ResultCache): Cache of the results of earlier simulations, None to run every replica
+        **options: Options passed on to run_simulation
+
+    Returns:
+        list: One list per point of the run_replica summary of each of its replicas
+    """
+    tasks, results, counts = sweep_tasks(points, replicas, seed, manifest, cache, options)
+    todo = [
+        (index, point, replica_seed, options)
+        for index, (point, replica, replica_seed) in enumerate(tasks)
+        if results[index] is None
+    ]
+    for chunk_results, chunk_time in _finished_chunks(todo, jobs):
+        for index, summary in chunk_results:
+            results[index] = summary
+            record_result(tasks[index], summary, manifest, cache, options)
+    return group_results(results, counts)
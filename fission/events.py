@@ -0,0 +1,295 @@
+# event-driven collision engine, an alternative to fixed time steps
+import heapq
+import numpy as np
+from .kernels import dragFlight, elasticCollisionBatch, scatterBatch
+from .reaction import fissionBatch
+from .species import SPECIES, NEUTRON, URANIUM
+
+# Kinds of events in the queue
+WALL_EVENT = 0
+PAIR_EVENT = 1
+
+
+class EventEngine:
+    """
+    A class running the simulation from one collision to the next instead of with a fixed time step. The time
+    of the next wall contact and the next particle contact of every particle is predicted from straight-line
+    motion and kept in a priority queue. The whole population jumps straight to the earliest event, with drag
+    integrated exactly in between (see dragFlight), then only the particles taking part in the event get new
+    predictions. Events of those particles already in the queue are invalidated by a per-particle counter.
+
+    Particles only collide when they come into contact, so pairs already closer than their contact distance
+    (for example right after scattering) do not collide again until they have separated. The exception is a
+    neutron inside the contact distance of a uranium atom, which undergoes fission straight away, as it would
+    on the next fixed time step. The run stops early once no neutron is left, since the uranium left could
+    never undergo fission.
+
+    Attributes:
+        store (ParticleStore): The store holding the particles
+        box_dim (float): Half of the length of one side of the cubic box
+        time (float): The simulated time(in s) reached so far
+        num_events (int): Number of wall and particle contacts handled
+        num_stale (int): Number of invalidated events dropped from the queue
+        drag_energy (float): Energy(in J) transferred to the water by drag so far
+        uranium_left (int): Number of uranium atoms left unreacted when the last run stopped
+    """
+
+    def __init__(self, store, box_dim, rng=np.random):
+        """
+        Initializes an EventEngine object
+
+        Parameters:
+            store (ParticleStore): The store holding the particles
+            box_dim (float): Half of the length of one side of the cubic box
+            rng (Generator): Random number generator, defaults to numpy's global one
+        """
+        self.store = store
+        self.box_dim = box_dim
+        self.rng = rng
+        self.time = 0.0
+        self.num_events = 0
+        self.num_stale = 0
+        self.drag_energy = 0.0
+        self.uranium_left = 0
+        self._queue = []
+        self._sequence = 0
+        # number of times every particle id got new predictions
+        self._counts = []
+
+    def _push(self, time, kind, particle_id, other_id, other_count, axis):
+        """
+        Adds an event to the queue, stamped with the current counts of the particles involved
+
+        Parameters:
+            time (float): The time(in s) the event happens at
+            kind (int): WALL_EVENT or PAIR_EVENT
+            particle_id (int): Id of the particle the event was predicted for
+            other_id (int): Id of the other particle of a PAIR_EVENT, -1 for a WALL_EVENT
+            other_count (int): Count of the other particle of a PAIR_EVENT, -1 for a WALL_EVENT
+            axis (int): Axis of the wall of a WALL_EVENT, -1 for a PAIR_EVENT
+
+        Returns:
+            None
+        """
+        event = (
+            time,
+            self._sequence,
+            kind,
+            particle_id,
+            self._counts[particle_id],
+            other_id,
+            other_count,
+            axis,
+        )
+        heapq.heappush(self._queue, event)
+        self._sequence += 1
+
+    def _wallLimit(self, species):
+        """
+        Obtains the coordinates at which particles touch the walls, as checked in Particle.collideWall
+
+        Parameters:
+            species (ndarray): Species id of every particle
+
+        Returns:
+            ndarray: N x 3 array of the largest absolute coordinate along every axis
+        """
+        radius = SPECIES.radius[species][:, None]
+        return self.box_dim - radius * np.array([1.0, 1.0, 1.0e3])
+
+    def _predictWall(self, row):
+        """
+        Predicts the next wall contact of one particle and queues it
+
+        Parameters:
+            row (int): Row of the particle in the store
+
+        Returns:
+            None
+        """
+        store = self.store
+        pos = store.pos[row]
+        v = store.vel[row]
+
+        # Time for each coordinate to reach the limit it is heading towards
+        limit = self._wallLimit(store.species[row : row + 1])[0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t_wall = np.where(v > 0, (limit - pos) / v, np.where(v < 0, (-limit - pos) / v, np.inf))
+        axis = int(np.argmin(t_wall))
+        if np.isfinite(t_wall[axis]):
+            particle_id = int(store.ids[row])
+            self._push(self.time + max(t_wall[axis], 0.0), WALL_EVENT, particle_id, -1, -1, axis)
+
+    def _predictPair(self, row):
+        """
+        Predicts the next contact of one particle with any other particle and queues it
+
+        Parameters:
+            row (int): Row of the particle in the store
+
+        Returns:
+            None
+        """
+        store = self.store
+        pos = store.pos
+        vel = store.vel
+        species = store.species
+        particle_id = int(store.ids[row])
+
+        # First time |dx + dv * t| reaches the contact distance while approaching
+        others = np.flatnonzero(np.arange(len(store)) != row)
+        if len(others) == 0:
+            return
+        dx = pos[others] - pos[row]
+        dv = vel[others] - vel[row]
+        contact = SPECIES.contact_radius[species[others]] + SPECIES.contact_radius[species[row]]
+        a = np.einsum("ij,ij->i", dv, dv)
+        b = np.einsum("ij,ij->i", dx, dv)
+        c = np.einsum("ij,ij->i", dx, dx) - contact**2
+        disc = b**2 - a * c
+
+        t_pair = np.full(len(others), np.inf)
+        entering = (c > 0) & (b < 0) & (disc >= 0)
+        t_pair[entering] = (-b[entering] - np.sqrt(disc[entering])) / a[entering]
+        fission = (c <= 0) & (
+            ((species[row] == NEUTRON) & (species[others] == URANIUM))
+            | ((species[row] == URANIUM) & (species[others] == NEUTRON))
+        )
+        t_pair[fission] = 0.0
+
+        first = int(np.argmin(t_pair))
+        if np.isfinite(t_pair[first]):
+            other_id = int(store.ids[others[first]])
+            self._push(
+                self.time + t_pair[first],
+                PAIR_EVENT,
+                particle_id,
+                other_id,
+                self._counts[other_id],
+                -1,
+            )
+
+    def _refresh(self, rows):
+        """
+        Invalidates the queued events of some particles and predicts new ones
+
+        Parameters:
+            rows (list): Rows of the particles in the store
+
+        Returns:
+            None
+        """
+        ids = self.store.ids[rows]
+        if len(ids) > 0 and ids.max() >= len(self._counts):
+            self._counts.extend([0] * (int(ids.max()) + 1 - len(self._counts)))
+        for particle_id in ids:
+            self._counts[particle_id] += 1
+        for row in rows:
+            self._predictWall(row)
+            self._predictPair(row)
+
+    def _advance(self, time):
+        """
+        Moves every particle to the given time
+
+        Parameters:
+            time (float): The time(in s) to move to
+
+        Returns:
+            None
+        """
+        if time > self.time:
+            store = self.store
+            self.drag_energy += dragFlight(store.pos, store.vel, store.species, time - self.time)
+            self.time = time
+
+    def _collide(self, row, other_row):
+        """
+        Applies the collision rules of Particle.collideParticle to one pair in contact
+
+        Parameters:
+            row (int): Row of the first particle in the store
+            other_row (int): Row of the second particle in the store
+
+        Returns:
+            bool: True when the pair underwent fission
+        """
+        store = self.store
+        pair_species = {int(store.species[row]), int(store.species[other_row])}
+        if pair_species == {NEUTRON, URANIUM}:
+            uranium_row = row if store.species[row] == URANIUM else other_row
+            species, pos, vel = fissionBatch(store.pos[[uranium_row]], self.rng)
+            store.remove([row, other_row])
+            new_ids = store.add(species, pos, vel)
+            self._refresh(list(store.rowsOf(new_ids)))
+            return True
+
+        pair = np.array([[row, other_row]])
+        if len(pair_species) == 1:
+            # Swap velocities and scatter in random directions
+            store.vel[[row, other_row]] = store.vel[[other_row, row]]
+            scatterBatch(store.vel, pair[0], self.rng)
+        else:
+            elasticCollisionBatch(
+                store.pos, store.vel, SPECIES.mass[store.species], store.species, pair, self.rng
+            )
+        self._refresh([row, other_row])
+        return False
+
+    def run(self, num_uranium):
+        """
+        Processes events until every uranium atom has undergone fission or no neutron is left
+
+        Parameters:
+            num_uranium (int): The number of uranium atoms left in the store
+
+        Returns:
+            int: The number of fission reactions that occurred
+        """
+        store = self.store
+        num_fission = 0
+        self._refresh(list(range(len(store))))
+        # walls keep requeueing heavy atoms, so the run has to stop by itself once the neutrons are gone
+        has_neutrons = bool(np.any(store.species == NEUTRON))
+
+        while num_uranium > 0 and has_neutrons and self._queue:
+            time, _, kind, particle_id, count, other_id, other_count, axis = heapq.heappop(
+                self._queue
+            )
+            row = store.rowsOf(particle_id)
+            if row < 0 or self._counts[particle_id] != count:
+                self.num_stale += 1
+                continue
+            if kind == PAIR_EVENT:
+                other_row = store.rowsOf(other_id)
+                if other_row < 0 or self._counts[other_id] != other_count:
+                    # the partner changed course since this was predicted, this particle did not
+                    self.num_stale += 1
+                    self._predictPair(row)
+                    continue
+
+            self._advance(time)
+            if kind == WALL_EVENT:
+                limit = self._wallLimit(store.species[row : row + 1])[0, axis]
+                side = np.sign(store.pos[row, axis])
+                if np.sign(store.vel[row, axis]) == side:
+                    store.vel[row, axis] = -store.vel[row, axis]
+                store.pos[row, axis] = side * limit
+                self._refresh([row])
+                self.num_events += 1
+                continue
+
+            # Drag slows particles slightly after their contact was predicted, check it still happens
+            contact = SPECIES.contact_radius[store.species[[row, other_row]]].sum()
+            dist = np.linalg.norm(store.pos[row] - store.pos[other_row])
+            if dist > contact * (1 + 1e-6):
+                self._predictPair(row)
+                continue
+            self.num_events += 1
+            if self._collide(row, other_row):
+                num_uranium -= 1
+                num_fission += 1
+                has_neutrons = bool(np.any(store.species == NEUTRON))
+
+        self.uranium_left = num_uranium
+        return num_fission
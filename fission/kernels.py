@@ -0,0 +1,496 @@
+# array kernels updating many particles of a ParticleStore at once
+import numpy as np
+from .species import SPECIES, NEUTRON
+
+
+def scatterBatch(vel, rows, rng=np.random):
+    """
+    Randomly scatters the velocity of several particles, the batched form of Particle.scatterRandomly
+
+    Parameters:
+        vel (ndarray): N x 3 array of particle velocities(in m/s)
+        rows (ndarray): Rows of the particles to scatter, each row at most once
+        rng (Generator): Random number generator, defaults to numpy's global one
+
+    Returns:
+        None
+    Outputs:
+        vel[rows] keeps its speed and gets a new random direction
+    """
+    if len(rows) == 0:
+        return
+    angles = rng.uniform(0, 1, (len(rows), 2)) * np.array([2 * np.pi, np.pi])
+    angle1 = angles[:, 0]
+    angle2 = angles[:, 1]
+    speed = np.linalg.norm(vel[rows], axis=1)
+
+    # Convert spherical to Cartesian coordinates
+    vel[rows, 0] = speed * np.sin(angle2) * np.cos(angle1)
+    vel[rows, 1] = speed * np.sin(angle2) * np.sin(angle1)
+    vel[rows, 2] = speed * np.cos(angle2)
+
+
+def elasticCollisionBatch(pos, vel, mass, species, pairs, rng=np.random):
+    """
+    Applies the collision rules of Particle.collideParticle to many colliding pairs at once. Particles of the
+    same species swap velocities and scatter. Other pairs get the momentum-conserving elastic update along the
+    line between their centres, or swap and scatter when their centres are closer than 1e-6 m.
+
+    Every particle must appear in at most one pair, so the pairs can be updated independently. When a particle
+    touches several others in the same step, the caller picks one contact per particle with matchPairs and the
+    other contacts are left for the following steps.
+
+    Parameters:
+        pos (ndarray): N x 3 array of particle positions(in m)
+        vel (ndarray): N x 3 array of particle velocities(in m/s)
+        mass (ndarray): N array of particle masses(in amu)
+        species (ndarray): N array of particle species ids
+        pairs (ndarray): M x 2 array of colliding particle index pairs, no index repeated
+        rng (Generator): Random number generator, defaults to numpy's global one
+
+    Returns:
+        None
+    Outputs:
+        vel of every particle in pairs is updated
+    """
+    if len(pairs) == 0:
+        return
+    i = pairs[:, 0]
+    j = pairs[:, 1]
+    vel_1 = vel[i]
+    vel_2 = vel[j]
+
+    offset = pos[i] - pos[j]
+    dist_sq = np.sum(offset**2, axis=1)
+    # Avoid division by zero or extremely small value
+    elastic = (species[i] != species[j]) & (dist_sq >= 1e-12)
+
+    # Momentum-conserving update, (v2 - v1).(x2 - x1) equals (v1 - v2).(x1 - x2)
+    e = np.flatnonzero(elastic)
+    mass_1 = mass[i[e]]
+    mass_2 = mass[j[e]]
+    proj = np.sum((vel_1[e] - vel_2[e]) * offset[e], axis=1) / dist_sq[e]
+    impulse = proj[:, None] * offset[e]
+    vel[i[e]] = vel_1[e] - (2 * mass_2 / (mass_1 + mass_2))[:, None] * impulse
+    vel[j[e]] = vel_2[e] + (2 * mass_1 / (mass_1 + mass_2))[:, None] * impulse
+
+    # Swap velocities and scatter in random directions
+    s = np.flatnonzero(~elastic)
+    vel[i[s]] = vel_2[s]
+    vel[j[s]] = vel_1[s]
+    scatterBatch(vel, np.concatenate((i[s], j[s])), rng)
+
+
+class StepKernel:
+    """
+    A class advancing every particle of a ParticleStore by one time step in a single pass: drag integration,
+    drag energy and wall reflection, the work of Particle.move, dragEnergy and Particle.collideWall. All
+    intermediate results go to work buffers that are kept between steps, so a step allocates no new arrays
+    unless the population outgrows the buffers. The buffers follow the precision of the store, while the drag
+    energy is always summed in float64.
+
+    Drag constants come from the species table, see SpeciesTable. The drag energy of every particle is scaled
+    by its statistical weight.
+
+    Two integrators are available. "euler" is the explicit update of Particle.move, drag applied to every
+    velocity component. "exact" uses the closed-form solution of quadratic drag opposing the motion, as in
+    dragFlight, with the drag energy 0.5 * m * (s0^2 - s1^2) equal to the work of the drag force of dragEnergy
+    over the distance travelled. It stays accurate with much larger time steps.
+
+    Attributes:
+        integrator (str): "euler" or "exact"
+        allocations (int): Number of work buffers allocated so far, only when the population outgrows them, see
+            precision_benchmark for the memory a step actually allocates
+        steps (int): Number of steps taken so far
+    """
+
+    def __init__(self, integrator="euler"):
+        """
+        Initializes a StepKernel object
+
+        Parameters:
+            integrator (str): "euler" for the explicit update of Particle.move, "exact" for the closed-form
+                quadratic drag solution
+        """
+        if integrator not in ("euler", "exact"):
+            raise ValueError(f"Unknown drag integrator: {integrator}")
+        self.integrator = integrator
+        self.allocations = 0
+        self.steps = 0
+        self._capacity = 0
+        self._dtype = None
+        self._version = None
+        self._box_dim = None
+
+    def _reserve(self, num_particles, dtype):
+        """
+        Makes sure the work buffers hold at least num_particles rows, doubling their size when they do not
+
+        Parameters:
+            num_particles (int): Number of particles in the store
+            dtype (dtype): Floating point type of the store's pos and vel columns
+
+        Returns:
+            None
+        """
+        if num_particles <= self._capacity and dtype == self._dtype:
+            return
+        capacity = max(num_particles, 2 * self._capacity)
+        self._vec = np.empty((capacity, 3), dtype=dtype)
+        self._hit = np.empty((capacity, 3), dtype=bool)
+        self._check_radius = np.empty((capacity, 3), dtype=dtype)
+        self._limit = np.empty((capacity, 3), dtype=dtype)
+        self._speed_sq = np.empty(capacity, dtype=dtype)
+        self._speed = np.empty(capacity, dtype=dtype)
+        self._accel_coeff = np.empty(capacity, dtype=dtype)
+        self._force_coeff = np.empty(capacity, dtype=dtype)
+        self._half_mass = np.empty(capacity, dtype=dtype)
+        self._growth = np.empty(capacity, dtype=dtype)
+        self._ratio = np.empty(capacity, dtype=dtype)
+        self._moving = np.empty(capacity, dtype=bool)
+        self.allocations += 12
+        self._capacity = capacity
+        self._dtype = dtype
+        self._version = None
+
+    def _prepare(self, store, box_dim):
+        """
+        Fills the per-particle constants, only when particles were added or removed or the box changed
+
+        Parameters:
+            store (ParticleStore): The store holding the particles
+            box_dim (float): Half of the length of one side of the cubic box
+
+        Returns:
+            None
+        """
+        if store.version == self._version and box_dim == self._box_dim:
+            return
+        n = len(store)
+        force_coeff = self._force_coeff[:n]
+        accel_coeff = self._accel_coeff[:n]
+        check_radius = self._check_radius[:n]
+        limit = self._limit[:n]
+
+        # only runs when the population changed, so plain lookups are fine here
+        species = store.species
+        force_coeff[:] = SPECIES.force_prefactor[species]
+        accel_coeff[:] = SPECIES.drag_prefactor[species]
+        self._half_mass[:n] = 0.5 * SPECIES.mass[species]
+
+        # the z-wall is checked against a padded radius, as in Particle.collideWall
+        radius = SPECIES.radius[species]
+        check_radius[:] = radius[:, None] * np.array([1.0, 1.0, 1.0e3])
+        limit[:] = box_dim - radius[:, None]
+
+        self._version = store.version
+        self._box_dim = box_dim
+
+    def _eulerDrag(self, n, vel, pos, weight, dt):
+        """
+        Applies one explicit Euler step of drag and motion, as in Particle.move and dragEnergy, using the work
+        buffers
+
+        Parameters:
+            n (int): Number of particles in the store
+            vel (ndarray): N x 3 array of particle velocities(in m/s), updated in place
+            pos (ndarray): N x 3 array of particle positions(in m), updated in place
+            weight (ndarray): N array of particle statistical weights, scaling their drag energy
+            dt (float or ndarray): The size of time step, for all particles or one per particle
+
+        Returns:
+            float: The energy transferred(lost) to surrounding water during the step
+        """
+        vec = self._vec[:n]
+        speed_sq = self._speed_sq[:n]
+        speed = self._speed[:n]
+        dt_column = dt if np.ndim(dt) == 0 else dt[:, None]
+
+        # Drag acts on every component, dv = -(0.5 * Cd * rho * A / m) * v^2 * dt, then the position update
+        np.square(vel, out=vec)
+        vec *= self._accel_coeff[:n, None]
+        vec *= dt_column
+        vel -= vec
+        np.multiply(vel, dt_column, out=vec)
+        pos += vec
+
+        # Drag energy W = F_drag * |v| * dt with the updated velocity
+        np.einsum("ij,ij->i", vel, vel, out=speed_sq)
+        np.sqrt(speed_sq, out=speed)
+        speed *= speed_sq
+        speed *= self._force_coeff[:n]
+        speed *= weight
+        if np.ndim(dt) > 0:
+            speed *= dt
+            return float(np.sum(speed, dtype=np.float64))
+        return float(np.sum(speed, dtype=np.float64)) * dt
+
+    def _exactDrag(self, n, vel, pos, weight, dt):
+        """
+        Applies the closed-form solution of quadratic drag over one step: with x = k * s0 * dt the speed becomes
+        s0 / (1 + x) and the particle travels s0 * dt * log1p(x) / x along its direction of motion
+
+        Parameters:
+            n (int): Number of particles in the store
+            vel (ndarray): N x 3 array of particle velocities(in m/s), updated in place
+            pos (ndarray): N x 3 array of particle positions(in m), updated in place
+            weight (ndarray): N array of particle statistical weights, scaling their drag energy
+            dt (float or ndarray): The size of time step, for all particles or one per particle
+
+        Returns:
+            float: The energy transferred(lost) to surrounding water during the step
+        """
+        vec = self._vec[:n]
+        speed_sq = self._speed_sq[:n]
+        speed = self._speed[:n]
+        growth = self._growth[:n]
+        ratio = self._ratio[:n]
+
+        np.einsum("ij,ij->i", vel, vel, out=speed_sq)
+        np.sqrt(speed_sq, out=speed)
+        np.multiply(self._accel_coeff[:n], speed, out=growth)
+        growth *= dt
+        # keeps log1p(x) / x finite for particles at rest, it is 1 there
+        np.maximum(growth, np.finfo(growth.dtype).tiny, out=growth)
+
+        # 0.5 * m * (s0^2 - s1^2) written as 0.5 * m * s0^2 * x * (2 + x) / (1 + x)^2
+        np.add(growth, 2, out=ratio)
+        ratio *= growth
+        speed_sq *= ratio
+        np.add(growth, 1, out=ratio)
+        np.square(ratio, out=ratio)
+        speed_sq /= ratio
+        speed_sq *= self._half_mass[:n]
+        speed_sq *= weight
+        drag_energy = float(np.sum(speed_sq, dtype=np.float64))
+
+        np.log1p(growth, out=ratio)
+        ratio /= growth
+        ratio *= dt
+        np.multiply(vel, ratio[:, None], out=vec)
+        pos += vec
+        np.add(growth, 1, out=ratio)
+        vel /= ratio[:, None]
+        return drag_energy
+
+    def step(self, store, dt, box_dim):
+        """
+        Moves every particle by one time step, collecting drag energy and reflecting particles at the walls
+
+        Parameters:
+            store (ParticleStore): The store holding the particles
+            dt (float or ndarray): The size of time step, for all particles or one per particle(0 leaves a
+                particle where it is)
+            box_dim (float): Half of the length of one side of the cubic box
+
+        Returns:
+            float: The total amount of energy transferred(lost) to surrounding water during the step
+        Outputs:
+            pos and vel columns of the store are updated in place
+        """
+        n = len(store)
+        self._reserve(n, store.dtype)
+        self._prepare(store, box_dim)
+        pos = store.pos
+        vel = store.vel
+        vec = self._vec[:n]
+        hit = self._hit[:n]
+
+        if self.integrator == "exact":
+            drag_energy = self._exactDrag(n, vel, pos, store.weight, dt)
+        else:
+            drag_energy = self._eulerDrag(n, vel, pos, store.weight, dt)
+        if np.isnan(drag_energy):
+            print("Warning: Invalid velocity detected!")
+
+        # Reflect the velocity and correct the position of particles touching a wall
+        np.abs(pos, out=vec)
+        vec += self._check_radius[:n]
+        np.greater_equal(vec, box_dim, out=hit)
+        if np.ndim(dt) > 0:
+            # particles left in place were already reflected when they reached the wall
+            moving = self._moving[:n]
+            np.greater(dt, 0, out=moving)
+            hit &= moving[:, None]
+        np.negative(vel, out=vel, where=hit)
+        np.sign(pos, out=vec)
+        vec *= self._limit[:n]
+        np.copyto(pos, vec, where=hit)
+
+        self.steps += 1
+        return drag_energy
+
+
+def dragFlight(pos, vel, species, t):
+    """
+    Moves particles for a time t under quadratic drag opposing their motion, F = 0.5 * Cd * rho * A * |v|^2,
+    integrated exactly: with k = 0.5 * Cd * rho * A / m the speed decays as s0 / (1 + k * s0 * t) and the
+    distance travelled along the unchanged direction is ln(1 + k * s0 * t) / k
+
+    Parameters:
+        pos (ndarray): N x 3 array of particle positions(in m)
+        vel (ndarray): N x 3 array of particle velocities(in m/s)
+        species (ndarray): N array of particle species ids
+        t (float or ndarray): Flight time(in s), for all particles or one per particle
+
+    Returns:
+        float: The energy(in J) transferred to the water during the flight, the kinetic energy lost to drag
+    Outputs:
+        pos and vel are updated in place
+    """
+    k = SPECIES.drag_prefactor[species]
+    t = np.asarray(t, dtype=float)
+    speed = np.sqrt(np.einsum("ij,ij->i", vel, vel))
+    growth = k * speed * t
+
+    # distance s0 * t * log1p(x) / x with x = k * s0 * t, which tends to s0 * t for small x
+    ratio = np.ones_like(growth)
+    moving = growth > 0
+    ratio[moving] = np.log1p(growth[moving]) / growth[moving]
+    pos += vel * (t * ratio)[:, None]
+
+    vel *= (1 / (1 + growth))[:, None]
+
+    # 0.5 * m * (s0^2 - s1^2), written without the cancellation of two nearly equal squares
+    lost_fraction = growth * (2 + growth) / (1 + growth) ** 2
+    mass = SPECIES.mass[species]
+    return float(np.sum(0.5 * mass * speed**2 * lost_fraction))
+
+
+class AdaptiveStep:
+    """
+    A class choosing the size of every time step of the fixed-step engine from two limits, and never more than
+    the dt asked for by the user:
+
+    - Accuracy: explicit Euler on quadratic drag has a relative velocity error of about (k * |v| * dt)^2 per
+      step, with k = 0.5 * Cd * rho * A / m, so dt <= sqrt(rtol) / max(k * |v|). The drag energy of a step
+      carries a relative error of about k * |v| * dt. When a tolerance on temp_change is given too, that error
+      is also kept small enough to keep temp_change within the tolerance, given the share of drag in the
+      energy reaching the water so far, the smaller of the two limits being taken.
+    - Contacts: no particle may cross more than a fraction cfl of a contact distance in one step relative to
+      another, or collisions and fission could be stepped over. Neutron-neutron contacts are nanometres wide
+      and only scatter neutrons among themselves, so they are left out of this limit.
+
+    Drag is so weak in the simulation (k * |v| is around 1e-17 1/s) that the contact limit is the one that
+    sets the step. A contact is found at most a fraction cfl of its width late, which shifts the time of the
+    reaction and of everything after it, and temp_change with it, so a tolerance on temp_change also lowers
+    cfl to temp_tol.
+
+    The exact integrator of StepKernel makes no drag error, so only the contact limit applies to it.
+
+    Attributes:
+        rtol (float): Relative tolerance on the velocity change of a step
+        temp_tol (float): Relative tolerance on temp_change, None to only use rtol
+        cfl (float): Largest fraction of a contact distance a particle may cross in one step, lowered to temp_tol
+            when that is smaller
+        integrator (str): Drag integrator of the StepKernel, "euler" or "exact"
+        dt_min (float): Smallest step taken so far
+        dt_max (float): Largest step taken so far
+    """
+
+    def __init__(self, rtol=1e-4, temp_tol=None, cfl=0.5, integrator="euler"):
+        """
+        Initializes an AdaptiveStep object
+
+        Parameters:
+            rtol (float): Relative tolerance on the velocity change of a step
+            temp_tol (float): Relative tolerance on temp_change, None to only use rtol
+            cfl (float): Largest fraction of a contact distance a particle may cross in one step
+            integrator (str): Drag integrator of the StepKernel, "euler" or "exact"
+        """
+        self.rtol = rtol
+        self.temp_tol = temp_tol
+        self.cfl = cfl if temp_tol is None else min(cfl, temp_tol)
+        self.integrator = integrator
+        self.dt_min = np.inf
+        self.dt_max = 0.0
+
+    def stepLimit(self, store, dt, fission_energy=0.0, drag_energy=0.0):
+        """
+        Obtains the size of the next time step
+
+        Parameters:
+            store (ParticleStore): The store holding the particles
+            dt (float): The largest time step allowed
+            fission_energy (float): Energy(in J) the fission reactions of the whole run release
+            drag_energy (float): Energy(in J) transferred to the water by drag so far
+
+        Returns:
+            float: The size of the next time step
+        """
+        species = store.species
+        speed = np.sqrt(np.einsum("ij,ij->i", store.vel, store.vel, dtype=np.float64))
+        if len(speed) == 0:
+            return dt
+        rate = np.max(SPECIES.drag_prefactor[species] * speed)
+        if self.integrator == "exact":
+            rate = 0.0
+
+        if rate > 0:
+            # velocity error (k|v|dt)^2 <= rtol, which also keeps Euler clear of its stability limit k|v|dt = 1
+            dt = min(dt, np.sqrt(self.rtol) / rate)
+        if rate > 0 and self.temp_tol is not None:
+            # drag energy error k|v|dt relative to the drag share of temp_change
+            allowed = self.temp_tol * (fission_energy + drag_energy) / max(drag_energy, 1e-300)
+            dt = min(dt, allowed / rate)
+
+        # smallest contact distance among pairs of the species present, leaving out neutron pairs
+        present = np.flatnonzero(SPECIES.count(species) > 0)
+        heavy = present[present != NEUTRON]
+        if len(heavy) > 0:
+            contact = SPECIES.contact_radius[heavy].min() + SPECIES.contact_radius[present].min()
+            max_speed = speed.max()
+            if max_speed > 0:
+                dt = min(dt, self.cfl * contact / (2 * max_speed))
+
+        dt = float(dt)
+        self.dt_min = min(self.dt_min, dt)
+        self.dt_max = max(self.dt_max, dt)
+        return dt
+
+
+def populationControl(store, low, high, rng=np.random):
+    """
+    Keeps the number of neutrons in a store between low and high without biasing any weighted tally. Above high,
+    a comb with a random offset keeps exactly high evenly spaced neutrons, at least one, so every neutron
+    survives with probability high / count and never all of them are lost, and the weight of the survivors is
+    multiplied by count / high. Below low, every neutron is split into equal copies sharing its weight, which
+    start where it is and separate at their first collision, and the comb then brings the copies down to high
+    when there are more of them.
+
+    Parameters:
+        store (ParticleStore): The store holding the particles
+        low (int): Smallest number of neutrons wanted
+        high (int): Largest number of neutrons wanted
+        rng (Generator): Random number generator, defaults to numpy's global one
+
+    Returns:
+        int: Number of neutrons added by splitting
+        int: Number of neutrons removed by the comb, counting the copies combed away again
+    Outputs:
+        Neutrons are added to or removed from the store and their weights updated
+    """
+    neutrons = np.flatnonzero(store.species == NEUTRON)
+    count = len(neutrons)
+    if count > high:
+        survivors = max(int(high), 1)
+        # teeth count / survivors >= 1 apart never pick the same neutron twice
+        teeth = ((rng.uniform(0, 1) + np.arange(survivors)) * (count / survivors)).astype(np.int64)
+        killed = np.ones(count, dtype=bool)
+        killed[teeth] = False
+        store.weight[neutrons[teeth]] *= count / survivors
+        store.remove(neutrons[killed])
+        return 0, count - survivors
+    if 0 < count < low:
+        copies = int(np.ceil(low / count))
+        store.weight[neutrons] /= copies
+        store.add(
+            NEUTRON,
+            np.repeat(store.pos[neutrons], copies - 1, axis=0),
+            np.repeat(store.vel[neutrons], copies - 1, axis=0),
+            np.repeat(store.weight[neutrons], copies - 1),
+        )
+        # ceil(low / count) copies of each neutron overshoot a narrow band, 4 neutrons in (5, 6) giving 8
+        removed = populationControl(store, low, high, rng)[1] if count * copies > high else 0
+        return count * (copies - 1), removed
+    return 0, 0
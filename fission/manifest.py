@@ -0,0 +1,226 @@
+# module for on-disk manifests of finished sweep work, so an interrupted sweep can resume where it stopped
+import json
+import numpy as np
+import os
+import time
+
+
+def _plain(value):
+    """
+    Converts the numpy values of a result to Python ones, for json.dumps
+
+    Parameters:
+        value (object): Value json does not know how to write
+
+    Returns:
+        object: The value as a Python number or list
+    """
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError(f"Cannot write {type(value).__name__} to a sweep manifest")
+
+
+class SweepManifest:
+    """
+    A class recording the finished work items of a sweep in a JSON lines file, one line per item, so that
+    running the same sweep again skips what was already done. A work item is one replica of one point of the
+    sweep, identified by its point, its replica number and its seed. The first line holds the entropy of the
+    root seed of the sweep, which stands in for the seed on resume when the sweep was started without one, and
+    the seed of every item is stored as its spawn key under that root.
+
+    Each line is appended with a single write to a file opened for appending, so a killed process leaves at
+    most one torn last line, which is cut off when the manifest is opened again. Lines are forced to disk with
+    fsync at most every sync_interval seconds and when the manifest is closed, so a machine going down loses at
+    most that much work.
+
+    Attributes:
+        path (str): Path of the manifest file
+        entropy (int): Entropy of the root seed of the sweep, None until the sweep is seeded
+        sync_interval (float): Longest time(in s) between a result being written and forced to disk
+        num_loaded (int): Number of items found finished when the manifest was opened
+        num_recorded (int): Number of items recorded since
+    """
+
+    def __init__(self, path, sync_interval=1.0):
+        """
+        Initializes a SweepManifest object, loading the items already in the file
+
+        Parameters:
+            path (str): Path of the manifest file, created when missing
+            sync_interval (float): Longest time(in s) between a result being written and forced to disk, 0 to
+                sync after every result
+        """
+        self.path = path
+        self.sync_interval = sync_interval
+        self.entropy = None
+        self.num_recorded = 0
+        self._results = {}
+        self._last_sync = time.time()
+        self._unsynced = False
+
+        created = not os.path.exists(path)
+        if not created:
+            self._load()
+        self.num_loaded = len(self._results)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if created:
+            # the new directory entry must reach the disk too, or the file can vanish with the machine
+            directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _key(point, replica, seed):
+        """
+        Builds the key identifying a work item
+
+        Parameters:
+            point (tuple): (num_neutrons, num_uranium, box_dim, dt) of the item
+            replica (int): Replica number of the item within its point, or number of replicas of a batch item
+            seed (SeedSequence): Seed of the item
+
+        Returns:
+            str: The key of the item
+        """
+        return json.dumps([list(point), replica, str(seed.entropy), list(seed.spawn_key)], default=_plain)
+
+    def _load(self):
+        """
+        Reads the finished items of the file, cutting off a torn last line left by an interrupted write
+
+        Returns:
+            None
+        """
+        with open(self.path, "rb") as manifest:
+            data = manifest.read()
+        complete = data.rfind(b"\n") + 1
+        if complete < len(data):
+            os.truncate(self.path, complete)
+
+        for line in data[:complete].splitlines():
+            entry = json.loads(line)
+            if "entropy" in entry:
+                self.entropy = int(entry["entropy"])
+            else:
+                seed = np.random.SeedSequence(self.entropy, spawn_key=entry["spawn_key"])
+                self._results[self._key(entry["point"], entry["replica"], seed)] = entry["result"]
+
+    def _append(self, entry):
+        """
+        Appends one line to the file with a single write, syncing it when the last sync is old enough
+
+        Parameters:
+            entry (dict): Content of the line
+
+        Returns:
+            None
+        """
+        os.write(self._fd, (json.dumps(entry, default=_plain) + "\n").encode())
+        self._unsynced = True
+        if time.time() - self._last_sync >= self.sync_interval:
+            self.sync()
+
+    def seedSequence(self, seed=None):
+        """
+        Obtains the root seed of the sweep, the one stored in the manifest when the sweep was seeded before
+
+        Parameters:
+            seed (int, SeedSequence or None): Root seed asked for, None to take the stored one or fresh entropy
+
+        Returns:
+            SeedSequence: The root seed of the sweep
+        """
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(self.entropy if seed is None else seed)
+        if self.entropy is None:
+            self.entropy = int(seed.entropy)
+            self._append({"entropy": str(self.entropy)})
+        elif seed.entropy != self.entropy:
+            raise ValueError(f"{self.path} records a sweep with another seed")
+        return seed
+
+    def get(self, point, replica, seed):
+        """
+        Obtains the result of a finished work item
+
+        Parameters:
+            point (tuple): (num_neutrons, num_uranium, box_dim, dt) of the item
+            replica (int): Replica number of the item within its point
+            seed (SeedSequence): Seed of the item
+
+        Returns:
+            dict: The recorded result, None when the item is not finished
+        """
+        return self._results.get(self._key(point, replica, seed))
+
+    def record(self, point, replica, seed, result):
+        """
+        Appends the result of a finished work item to the manifest
+
+        Parameters:
+            point (tuple): (num_neutrons, num_uranium, box_dim, dt) of the item
+            replica (int): Replica number of the item within its point
+            seed (SeedSequence): Seed of the item
+            result (dict): Result of the item, with values json or numpy can write
+
+        Returns:
+            None
+        """
+        self._append(
+            {
+                "point": list(point),
+                "replica": replica,
+                "spawn_key": list(seed.spawn_key),
+                "result": result,
+            }
+        )
+        self._results[self._key(point, replica, seed)] = json.loads(json.dumps(result, default=_plain))
+        self.num_recorded += 1
+
+    def sync(self):
+        """
+        Forces the lines written so far to disk
+
+        Returns:
+            None
+        """
+        if self._unsynced:
+            os.fsync(self._fd)
+            self._unsynced = False
+        self._last_sync = time.time()
+
+    def close(self):
+        """
+        Syncs and closes the manifest file
+
+        Returns:
+            None
+        """
+        if self._fd is not None:
+            self.sync()
+            os.close(self._fd)
+            self._fd = None
+
+
+def root_seed(seed=None, manifest=None):
+    """
+    Obtains the root seed of a sweep, the one of its manifest when it has one
+
+    Parameters:
+        seed (int, SeedSequence or None): Root seed asked for, None for the manifest's or fresh entropy
+        manifest (SweepManifest): Manifest of the sweep, None for a sweep without one
+
+    Returns:
+        SeedSequence: The root seed of the sweep
+    """
+    if manifest is not None:
+        return manifest.seedSequence(seed)
+    return seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
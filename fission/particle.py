@@ -3,19 +3,34 @@ import math
 import numpy as np
 import random
 from .reaction import fissionReaction
+from .species import SPECIES, NEUTRON, URANIUM, BARIUM, KRYPTON
 
 
 class Particle:
     """
     A class representing particles in simulation
+
+    A Particle either owns its pos and vel, or is a view of one particle of a ParticleStore,
+    in which case pos and vel are read from and written to the store columns.
+
+    Particles keep no per-instance __dict__: mass, radius and species are class constants of each subclass,
+    and eng is only computed when it is read, then kept until the velocity changes.
+
     Attributes:
         pos (list): The position(in m) of the particle within a cubic box
         vel (list): The velocity(in m/s^2) of the particle
         mass (integer): The mass(in amu) of the particle
         radius (float): The radius(in m) of the particle
         eng (float): The kinetic energy(in J) of the particle
+        species (int): The species id of the particle in a ParticleStore
     """
 
+    __slots__ = ("_pos", "_vel", "_eng", "_store", "_id")
+
+    species = None
+    mass = 1
+    radius = 0
+
     def __init__(self, pos, vel):
         """
         Initializes a Particle object
@@ -24,11 +39,80 @@ class Particle:
             pos (list): The position(in m) of the particle within a cubic box
             vel (list): The velocity(in m/s^2) of the particle
         """
-        self.pos = pos
-        self.vel = vel
-        self.mass = 1
-        self.radius = 0
-        self.eng = self.getEng()
+        self._store = None
+        self._id = None
+        self._pos = pos
+        self._vel = vel
+        self._eng = None
+
+    @classmethod
+    def view(cls, store, particle_id):
+        """
+        Creates a Particle object that is a view of one particle of a ParticleStore
+
+        Parameters:
+            store (ParticleStore): The store holding the particle's data
+            particle_id (int): The stable id of the particle within the store
+
+        Returns:
+            Particle: Particle object reading and writing its pos and vel through the store
+        """
+        particle = cls.__new__(cls)
+        particle._store = store
+        particle._id = particle_id
+        particle._eng = None
+        return particle
+
+    def _row(self):
+        """
+        Obtains the row of a view's particle within its store
+
+        Returns:
+            int: The current row of the particle
+        """
+        row = self._store.rowsOf(self._id)
+        if row < 0:
+            raise KeyError(f"Particle {self._id} is no longer in the store")
+        return row
+
+    @property
+    def pos(self):
+        if self._store is None:
+            return self._pos
+        # copies so that callers editing the returned array do not alias store rows
+        return self._store.pos[self._row()].copy()
+
+    @pos.setter
+    def pos(self, new_pos):
+        if self._store is None:
+            self._pos = new_pos
+        else:
+            self._store.pos[self._row()] = new_pos
+
+    @property
+    def vel(self):
+        if self._store is None:
+            return self._vel
+        return self._store.vel[self._row()].copy()
+
+    @vel.setter
+    def vel(self, new_vel):
+        self._eng = None
+        if self._store is None:
+            self._vel = new_vel
+        else:
+            self._store.vel[self._row()] = new_vel
+
+    @property
+    def eng(self):
+        # a view's velocity can change through its store, so only owned particles keep eng
+        if self._eng is None or self._store is not None:
+            return self.getEng()
+        return self._eng
+
+    @eng.setter
+    def eng(self, new_eng):
+        self._eng = new_eng
 
     def move(self, drag_coeff, dt):
         """
@@ -42,30 +126,23 @@ class Particle:
             None
 
         Outputs:
-            Particle objects's position, velocity, and energy updated
+            Particle objects's position and velocity updated, energy recomputed when next read
         """
 
-        cross_sectional_area = np.pi * (self.radius**2)
+        cross_sectional_area = math.pi * (self.radius**2)
         # drag_coeff = 0.47  # assuming spherical particles
         water_density = 1000  # kg/m^3 for water
-        # Drag force calculation (F_drag = 0.5 * Cd * rho * A * v^2)
-
-        drag_force = (
-            0.5
-            * drag_coeff
-            * water_density
-            * cross_sectional_area
-            * np.square(self.vel)
-        )
+        # Drag force calculation (F_drag = 0.5 * Cd * rho * A * v^2), scalar factors first
+        # so that only the velocity itself goes through array arithmetic
+        drag_factor = 0.5 * drag_coeff * water_density * cross_sectional_area
 
-        # drag_force = 0.5 * drag_coeff * np.square(self.vel)
         # Apply drag force to each component of velocity
-        accel = drag_force / self.mass
+        vel = np.asarray(self.vel, dtype=float)
+        accel_dt = (drag_factor / self.mass * dt) * np.square(vel)
 
         # Update velocity and position
-        new_vel = self.vel - (accel * dt)
+        new_vel = vel - accel_dt
         self.updVel(new_vel)
-        self.updEng(self.getEng())
         new_pos = self.pos + (new_vel * dt)
         self.pos = new_pos
 
@@ -174,10 +251,13 @@ class Particle:
             Updates both Particle object's velocities accordingly and scatters them in a random direction
             If a Neutron and Uranium object collide generates and returns necessary fission products
         """
-        min_dist = (self.getRadius() + other_particle.getRadius()) * 1.0e9
+        min_dist = (
+            SPECIES.contact_radius[self.species]
+            + SPECIES.contact_radius[other_particle.species]
+        )
         if self.distanceFrom(other_particle) <= min_dist:
             # Case 1: Both particles are of the same type (swap velocities and scatter)
-            if self.__class__.__name__ == other_particle.__class__.__name__:
+            if self.species == other_particle.species:
                 vel_1 = self.getVel()
                 vel_2 = other_particle.getVel()
 
@@ -190,15 +270,9 @@ class Particle:
                 other_particle.scatterRandomly()
 
             # Case 2: Neutron and Uranium collision (fission event)
-            elif (
-                self.__class__.__name__ == "Neutron"
-                and other_particle.__class__.__name__ == "Uranium"
-            ) or (
-                self.__class__.__name__ == "Uranium"
-                and other_particle.__class__.__name__ == "Neutron"
-            ):
+            elif {self.species, other_particle.species} == {NEUTRON, URANIUM}:
                 # All the generated particles' velocity are relative to the neutron particle before fission reaction.
-                if self.__class__.__name__ == "Uranium":
+                if self.species == URANIUM:
                     fission_products = fissionReaction(
                         self.pos, Barium, Krypton, Neutron
                     )
@@ -366,17 +440,11 @@ class Neutron(Particle):
         eng (float): The kinetic energy(in J) of the particle
     """
 
-    def __init__(self, pos, vel):
-        """
-        Initializes a Neutron object
+    __slots__ = ()
 
-        Parameters:
-            pos (list): The position(in m) of the particle within a cubic box
-            vel (list): The velocity(in m/s^2) of the particle
-        """
-        super().__init__(pos, vel)
-        self.mass = 1  # kilograms
-        self.radius = 8.0e-16  # meters
+    species = NEUTRON
+    mass = SPECIES.mass[NEUTRON]  # amu
+    radius = SPECIES.radius[NEUTRON]  # meters
 
 
 class Uranium(Particle):
@@ -391,17 +459,11 @@ class Uranium(Particle):
         eng (float): The kinetic energy(in J) of the particle
     """
 
-    def __init__(self, pos, vel):
-        """
-        Initializes a Uranium object
+    __slots__ = ()
 
-        Parameters:
-            pos (list): The position(in m) of the particle within a cubic box
-            vel (list): The velocity(in m/s^2) of the particle
-        """
-        super().__init__(pos, vel)
-        self.mass = 235  # kilograms
-        self.radius = 2.4e-10  # meters
+    species = URANIUM
+    mass = SPECIES.mass[URANIUM]  # amu
+    radius = SPECIES.radius[URANIUM]  # meters
 
 
 class Barium(Particle):
@@ -416,17 +478,11 @@ class Barium(Particle):
         eng (float): The kinetic energy(in J) of the particle
     """
 
-    def __init__(self, pos, vel):
-        """
-        Initializes a Barium object
+    __slots__ = ()
 
-        Parameters:
-            pos (list): The position(in m) of the particle within a cubic box
-            vel (list): The velocity(in m/s^2) of the particle
-        """
-        super().__init__(pos, vel)
-        self.mass = 141  # 2.3396e-25 #kilograms
-        self.radius = 2.68e-10  # meters
+    species = BARIUM
+    mass = SPECIES.mass[BARIUM]  # amu
+    radius = SPECIES.radius[BARIUM]  # meters
 
 
 class Krypton(Particle):
@@ -441,14 +497,55 @@ class Krypton(Particle):
         eng (float): The kinetic energy(in J) of the particle
     """
 
-    def __init__(self, pos, vel):
-        """
-        Initializes a Krypton object
+    __slots__ = ()
 
-        Parameters:
-            pos (list): The position(in m) of the particle within a cubic box
-            vel (list): The velocity(in m/s^2) of the particle
-        """
-        super().__init__(pos, vel)
-        self.mass = 92  # 1.52579e-27 #kilograms
-        self.radius = 2.02e-10  # meters
+    species = KRYPTON
+    mass = SPECIES.mass[KRYPTON]  # amu
+    radius = SPECIES.radius[KRYPTON]  # meters
+
+
+# Particle classes by species id, species added to the table later get a class from particle_class
+SPECIES_CLASSES = {
+    particle_class.species: particle_class
+    for particle_class in (Neutron, Uranium, Barium, Krypton)
+}
+
+
+def particle_class(species):
+    """
+    Obtains the Particle subclass of a species, creating it from the species table when it has none yet
+
+    Parameters:
+        species (int): The species id
+
+    Returns:
+        type: The Particle subclass whose objects represent that species
+    """
+    if species not in SPECIES_CLASSES:
+        SPECIES_CLASSES[species] = type(
+            SPECIES.names[species],
+            (Particle,),
+            {
+                "__slots__": (),
+                "species": species,
+                "mass": SPECIES.mass[species],
+                "radius": SPECIES.radius[species],
+            },
+        )
+    return SPECIES_CLASSES[species]
+
+
+def store_particles(store):
+    """
+    Creates Particle objects that are views of every particle of a ParticleStore
+
+    Parameters:
+        store (ParticleStore): The store holding the particles' data
+
+    Returns:
+        list: Neutron, Uranium, Barium and Krypton objects in store row order
+    """
+    return [
+        particle_class(species).view(store, particle_id)
+        for particle_id, species in zip(store.ids.tolist(), store.species.tolist())
+    ]
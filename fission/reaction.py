@@ -1,5 +1,10 @@
 # fission reaction methods
 import numpy as np
+from .species import NEUTRON, BARIUM, KRYPTON
+
+# Products of one fission reaction and the scale of their random velocity components(in m/s)
+FISSION_PRODUCTS = np.array([BARIUM, KRYPTON, NEUTRON, NEUTRON, NEUTRON])
+FISSION_PRODUCT_SPEEDS = np.array([10.0, 7.0, 14.0, 14.0, 14.0])
 
 
 # Method for fission reaction
@@ -33,6 +38,71 @@ def fissionReaction(uranium_pos, Barium, Krypton, Neutron):
     return [barium, krypton, new_neutron_1, new_neutron_2, new_neutron_3]
 
 
+def matchPairs(pairs, key):
+    """
+    Picks the pairs to resolve when particles take part in several contacts at once. Pairs are taken greedily
+    in order of key (ties broken by the particle indices), skipping any pair that shares a particle with a pair
+    already taken, so every particle is in at most one chosen pair and the choice is deterministic.
+
+    Parameters:
+        pairs (ndarray): M x 2 array of particle index pairs
+        key (ndarray): M array, pairs with a smaller key are taken first (e.g. the distance between the particles)
+
+    Returns:
+        ndarray: Indices into pairs of the chosen pairs, in the order they were taken
+    """
+    if len(pairs) == 0:
+        return np.empty(0, dtype=np.int64)
+    order = np.lexsort((pairs[:, 1], pairs[:, 0], key))
+    ranked = pairs[order]
+    num_particles = int(ranked.max()) + 1
+
+    # Each round takes every pair that comes first for both of its particles, which is what a sequential
+    # greedy pass would take, then drops the pairs touching the particles just taken
+    chosen = []
+    remaining = np.arange(len(ranked))
+    while len(remaining) > 0:
+        first = np.full(num_particles, len(ranked))
+        np.minimum.at(first, ranked[remaining, 0], remaining)
+        np.minimum.at(first, ranked[remaining, 1], remaining)
+        wins = (first[ranked[remaining, 0]] == remaining) & (
+            first[ranked[remaining, 1]] == remaining
+        )
+        chosen.append(remaining[wins])
+
+        taken = np.zeros(num_particles, dtype=bool)
+        taken[ranked[remaining[wins]].ravel()] = True
+        free = ~(taken[ranked[remaining, 0]] | taken[ranked[remaining, 1]])
+        remaining = remaining[free]
+
+    return order[np.sort(np.concatenate(chosen))]
+
+
+def fissionBatch(uranium_pos, rng=np.random):
+    """
+    Executes logic for many fission reactions at once, the batched form of fissionReaction
+
+    Parameters:
+        uranium_pos (ndarray): K x 3 array with the position of every Uranium atom undergoing fission
+        rng (Generator): Random number generator, defaults to numpy's global one
+
+    Returns:
+        ndarray: 5K array with the species id of every product (Barium, Krypton and 3 neutrons per reaction)
+        ndarray: 5K x 3 array with the position of every product, the position of its Uranium atom
+        ndarray: 5K x 3 array with the randomly determined velocity of every product
+    """
+    num_reactions = len(uranium_pos)
+    num_products = len(FISSION_PRODUCTS)
+
+    # One draw for the velocities of every product of every reaction
+    velocity = rng.uniform(-1, 1, (num_reactions, num_products, 3))
+    velocity *= FISSION_PRODUCT_SPEEDS[None, :, None]
+
+    species = np.tile(FISSION_PRODUCTS, num_reactions)
+    pos = np.repeat(np.asarray(uranium_pos, dtype=float), num_products, axis=0)
+    return species, pos, velocity.reshape(-1, 3)
+
+
 def dragEnergy(dt, velocity, radius):
     """
     Calculates the amount of energy transferred to the surrounding water as particles move through box
@@ -0,0 +1,282 @@
+# module for scheduling sweeps whose simulations differ widely in cost, longest predicted simulations first
+import numpy as np
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from .ensemble import _run_chunk, group_results, record_result, sweep_tasks
+
+
+class CostModel:
+    """
+    A class predicting the time a simulation takes from its parameters, with a power law fitted to observed
+    run times: log(cost) is linear in log(1 + num_neutrons), log(1 + num_uranium), log(box_dim) and log(dt).
+    Uranium sets the length of a run, as it only ends once every atom has undergone fission, while more
+    neutrons end it sooner, so the two counts get their own exponents. Before any observation the model guesses
+    the exponents measured with the step engine, and every fit is pulled towards that guess with a ridge
+    penalty, so a few observations cannot send the prediction of far away points astray.
+
+    Attributes:
+        coefficients (ndarray): Fitted intercept and exponents of the neutron count, uranium count, box_dim
+            and dt
+        observations (int): Number of run times the model was fitted to
+    """
+
+    # intercept and exponents of the neutron count, uranium count, box_dim and dt assumed before any observation
+    PRIOR = np.array([np.log(1e-4), 0.5, 1.5, 1.0, 0.0])
+
+    def __init__(self, ridge=1.0):
+        """
+        Initializes a CostModel object
+
+        Parameters:
+            ridge (float): Weight of the pull of the coefficients towards PRIOR
+        """
+        self.ridge = ridge
+        self.coefficients = self.PRIOR.copy()
+        self.observations = 0
+        self._features = []
+        self._log_costs = []
+
+    @staticmethod
+    def _design(points):
+        """
+        Builds the features of the model from simulation parameters
+
+        Parameters:
+            points (list): (num_neutrons, num_uranium, box_dim, dt) tuples
+
+        Returns:
+            ndarray: M x 5 array of features, a column of ones then the logarithms of the neutron count, uranium
+                count, box_dim and dt
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 4)
+        return np.column_stack(
+            (
+                np.ones(len(points)),
+                np.log1p(points[:, 0]),
+                np.log1p(points[:, 1]),
+                np.log(points[:, 2]),
+                np.log(points[:, 3]),
+            )
+        )
+
+    def predict(self, points):
+        """
+        Predicts the time taken by simulations
+
+        Parameters:
+            points (list): (num_neutrons, num_uranium, box_dim, dt) tuples
+
+        Returns:
+            ndarray: Predicted time(in s) of one simulation at every point
+        """
+        return np.exp(self._design(points) @ self.coefficients)
+
+    def observe(self, points, costs):
+        """
+        Adds observed run times and refits the coefficients
+
+        Parameters:
+            points (list): (num_neutrons, num_uranium, box_dim, dt) tuples of the simulations that ran
+            costs (list): Time(in s) taken by every one of them
+
+        Returns:
+            None
+        """
+        self._features.extend(self._design(points))
+        # runs too short for the clock are taken as a microsecond
+        self._log_costs.extend(np.log(np.maximum(costs, 1e-6)))
+        self.observations = len(self._log_costs)
+
+        # ridge regression towards PRIOR: minimizes |X c - y|^2 + ridge * |c - PRIOR|^2
+        features = np.asarray(self._features)
+        penalty = np.sqrt(self.ridge) * np.eye(len(self.PRIOR))
+        lhs = np.vstack((features, penalty))
+        rhs = np.concatenate((self._log_costs, penalty @ self.PRIOR))
+        self.coefficients = np.linalg.lstsq(lhs, rhs, rcond=None)[0]
+
+
+class SweepScheduler:
+    """
+    A class running every replica of every point of a sweep, longest predicted simulations first. Only jobs
+    chunks of simulations are in flight at a time, and every finished chunk refines the cost model before the
+    next chunk is picked, so the order adapts to the costs the sweep actually shows. Simulations predicted to
+    take under min_chunk_time are sent together, so short simulations are not slowed down by passing them one
+    by one. Replicas get the same seeds as with run_ensemble, so results are the same whatever order they ran in.
+
+    With a manifest or a result cache, replicas they hold are skipped and their run times train the cost model
+    before anything runs, and every replica run is recorded as soon as its chunk comes back.
+
+    Attributes:
+        model (CostModel): Model predicting the cost of every simulation
+        jobs (int): Number of processes, 1 to run everything in this process
+        wall_time (float): Time(in s) the last run took
+        busy_time (float): Time(in s) the processes spent running simulations, summed over the processes
+        num_chunks (int): Number of chunks sent to the processes
+    """
+
+    def __init__(
+        self,
+        points,
+        replicas=1,
+        seed=None,
+        jobs=1,
+        model=None,
+        manifest=None,
+        cache=None,
+        min_chunk_time=0.05,
+        options=None,
+    ):
+        """
+        Initializes a SweepScheduler object
+
+        Parameters:
+            points (list): (num_neutrons, num_uranium, box_dim, dt) tuples to simulate
+            replicas (int or list): Number of runs of every point, or one number per point
+            seed (int, SeedSequence or None): Root seed of the sweep, None for fresh entropy from the system
+            jobs (int): Number of processes, 1 to run everything in this process
+            model (CostModel): Model predicting the cost of every simulation, refined by the sweep, a new one
+                when None
+            manifest (SweepManifest): Manifest recording the finished replicas, None to keep results in memory
+                only
+            cache (ResultCache): Cache of the results of earlier simulations, None to run every replica
+            min_chunk_time (float): Predicted time(in s) below which simulations are sent in chunks
+            options (dict): Options passed on to run_simulation
+        """
+        self.model = CostModel() if model is None else model
+        self.manifest = manifest
+        self.cache = cache
+        self.jobs = jobs
+        self.min_chunk_time = min_chunk_time
+        self.options = {} if options is None else options
+        self.wall_time = 0.0
+        self.busy_time = 0.0
+        self.num_chunks = 0
+
+        self._tasks, self._results, self._counts = sweep_tasks(
+            points, replicas, seed, manifest, cache, self.options
+        )
+        self._predicted = np.zeros(len(self._tasks))
+        finished = np.array([result is not None for result in self._results], dtype=bool)
+        self._pending = np.flatnonzero(~finished)
+
+        # replicas finished before already tell how long simulations take
+        if np.any(finished):
+            self.model.observe(
+                [self._tasks[index][0] for index in np.flatnonzero(finished)],
+                [self._results[index]["total_time"] for index in np.flatnonzero(finished)],
+            )
+
+    def _nextChunk(self):
+        """
+        Takes the pending task with the longest predicted cost, followed by the next longest while the chunk is
+        predicted to take under min_chunk_time
+
+        Returns:
+            list: (index, point, seed, options) of every task of the chunk
+        """
+        tasks = self._tasks
+        costs = self.model.predict([tasks[index][0] for index in self._pending])
+        order = np.argsort(-costs, kind="stable")
+        pending = self._pending[order]
+        costs = costs[order]
+        size = min(len(pending), int(np.searchsorted(np.cumsum(costs), self.min_chunk_time)) + 1)
+
+        self._predicted[pending[:size]] = costs[:size]
+        self._pending = pending[size:]
+        return [(index, tasks[index][0], tasks[index][2], self.options) for index in pending[:size]]
+
+    def _collect(self, chunk_results, chunk_time):
+        """
+        Keeps the results of a finished chunk and refines the model with their run times
+
+        Parameters:
+            chunk_results (list): (index, summary) of every task of the chunk
+            chunk_time (float): Time(in s) the chunk kept its process busy
+
+        Returns:
+            None
+        """
+        for index, summary in chunk_results:
+            self._results[index] = summary
+            record_result(self._tasks[index], summary, self.manifest, self.cache, self.options)
+        self.model.observe(
+            [self._tasks[index][0] for index, summary in chunk_results],
+            [summary["total_time"] for index, summary in chunk_results],
+        )
+        self.busy_time += chunk_time
+        self.num_chunks += 1
+
+    def run(self):
+        """
+        Runs every pending task
+
+        Returns:
+            list: One list per point of the run_replica summary of each of its replicas
+        """
+        start_time = time.time()
+        if self.jobs == 1:
+            while len(self._pending) > 0:
+                self._collect(*_run_chunk(self._nextChunk()))
+        else:
+            with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+                running = set()
+                while len(self._pending) > 0 or running:
+                    while len(self._pending) > 0 and len(running) < self.jobs:
+                        running.add(pool.submit(_run_chunk, self._nextChunk()))
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._collect(*future.result())
+        self.wall_time = time.time() - start_time
+        return group_results(self._results, self._counts)
+
+    def report(self):
+        """
+        Summarizes how well the last run kept the processes busy and how well its costs were predicted
+
+        Returns:
+            dict: The wall_time(in s) of the run, the busy_time(in s) summed over the processes, the worker
+                utilization busy_time / (jobs * wall_time), the number of tasks and chunks, and the
+                prediction_error, the mean absolute log error of the cost predicted when each task was sent
+        """
+        # only the replicas run here were predicted, those taken from a manifest or cache were not
+        ran = self._predicted > 0
+        observed = np.array([summary["total_time"] for summary in self._results])[ran]
+        predicted = self._predicted[ran]
+        error = np.mean(np.abs(np.log(np.maximum(observed, 1e-6) / predicted))) if len(observed) > 0 else 0.0
+        return {
+            "wall_time": self.wall_time,
+            "busy_time": self.busy_time,
+            "utilization": self.busy_time / (self.jobs * self.wall_time) if self.wall_time > 0 else 1.0,
+            "tasks": len(self._tasks),
+            "chunks": self.num_chunks,
+            "prediction_error": float(error),
+        }
+
+
+def run_scheduled(
+    points, replicas=1, seed=None, jobs=1, model=None, manifest=None, cache=None, report=None, **options
+):
+    """
+    Runs every replica of every point of a sweep with a SweepScheduler, longest predicted simulations first,
+    the form of run_ensemble for sweeps whose simulations differ widely in cost
+
+    Parameters:
+        points (list): (num_neutrons, num_uranium, box_dim, dt) tuples to simulate
+        replicas (int or list): Number of runs of every point, or one number per point
+        seed (int, SeedSequence or None): Root seed of the sweep, None for fresh entropy from the system
+        jobs (int): Number of processes, 1 to run everything in this process
+        model (CostModel): Model predicting the cost of every simulation, refined by the sweep, a new one when
+            None
+        manifest (SweepManifest): Manifest recording the finished replicas, None to keep results in memory only
+        cache (ResultCache): Cache of the results of earlier simulations, None to run every replica
+        report (dict): Optional dictionary filled with the SweepScheduler report, worker utilization included
+        **options: Options passed on to run_simulation
+
+    Returns:
+        list: One list per point of the run_replica summary of each of its replicas
+    """
+    scheduler = SweepScheduler(points, replicas, seed, jobs, model, manifest, cache, options=options)
+    results = scheduler.run()
+    if report is not None:
+        report.update(scheduler.report())
+    return results
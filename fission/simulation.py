@@ -1,10 +1,45 @@
 import numpy as np
 import time
-from .particle import Neutron, Uranium, Barium, Krypton
-from .reaction import heatRelease, dragEnergy
+from .broadphase import FissionIndex, NeighborList, contact_pairs, neutron_pairs
+from .dsmc import DSMCCollisions
+from .events import EventEngine
+from .kernels import AdaptiveStep, StepKernel, elasticCollisionBatch, populationControl
+from .particle import store_particles
+from .reaction import fissionBatch, heatRelease, matchPairs
+from .species import SPECIES, NEUTRON, URANIUM, BARIUM, KRYPTON
+from .store import ParticleStore
+from .transport import TrackLengthTransport
 
 
 # Function to generate initial particles
+def generate_store(num_neutrons, num_uranium, box_dim, precision="float64", rng=np.random):
+    """
+    Distributes neutrons and uranium atoms within the dimensions of the box according to an exponential distribution
+
+    Parameters:
+        num_nuetrons (int): The number of neutrons to disperse within box
+        num_uranium (int): The number of uranium atoms to disperse wihin box
+        box_dim (float): Half of the length of one side of the cubic box the particles will be simulated in
+        precision (str): Floating point type of positions and velocities, "float64" or "float32"
+        rng (Generator): Random number generator, defaults to numpy's global one
+
+    Returns:
+        ParticleStore: A store containing the neutrons followed by the uranium atoms
+    """
+    store = ParticleStore(capacity=num_neutrons + num_uranium, dtype=precision)
+
+    # Generate neutrons with high random velocities
+    pos = rng.exponential(scale=box_dim / 5, size=(num_neutrons, 3))
+    vel = rng.exponential(scale=50, size=(num_neutrons, 3))  # Neutrons move faster
+    store.add(NEUTRON, pos, vel)
+
+    # Generate uranium with lower random velocities
+    pos = rng.exponential(scale=box_dim / 5, size=(num_uranium, 3))
+    vel = rng.exponential(scale=10, size=(num_uranium, 3))  # Uranium moves slower
+    store.add(URANIUM, pos, vel)
+    return store
+
+
 def generate_particles(num_neutrons, num_uranium, box_dim):
     """
     Distributes Neutron and Uranium objects within the dimensions of the box according to an exponential distribution
@@ -17,20 +52,7 @@ def generate_particles(num_neutrons, num_uranium, box_dim):
     Returns:
         list: A list containing the Nuetron and Uranium objects generated
     """
-    particles = []
-
-    # Generate neutrons with high random velocities
-    for i in range(num_neutrons):
-        pos = np.random.exponential(scale=box_dim / 5, size=3).tolist()
-        vel = np.random.exponential(scale=50, size=3).tolist()  # Neutrons move faster
-        particles.append(Neutron(pos, vel))
-
-    # Generate uranium with lower random velocities
-    for j in range(num_uranium):
-        pos = np.random.exponential(scale=box_dim / 5, size=3).tolist()
-        vel = np.random.exponential(scale=10, size=3).tolist()  # Uranium moves slower
-        particles.append(Uranium(pos, vel))
-    return particles
+    return store_particles(generate_store(num_neutrons, num_uranium, box_dim))
 
 
 def total_mass_particles(num_neutrons, num_uranium, num_barium, num_krypton):
@@ -44,16 +66,289 @@ def total_mass_particles(num_neutrons, num_uranium, num_barium, num_krypton):
         num_krypton (int): The number of Krypton objects present in simulation
 
     Returns:
-        int: The total mass of the system in amu
+        float: The total mass of the system in amu
     """
-    total_mass = (
-        num_neutrons * 1 + num_uranium * 235 + num_barium * 141 + num_krypton * 92
-    )
-    return total_mass
+    counts = np.array([num_neutrons, num_uranium, num_barium, num_krypton])
+    return float(counts @ SPECIES.mass[[NEUTRON, URANIUM, BARIUM, KRYPTON]])
+
+
+def print_particle_counts(species, when):
+    """
+    Prints how many particles of every species there are and their total mass
+
+    Parameters:
+        species (ndarray): The species id of every particle
+        when (str): "before" or "after", which end of the simulation the counts belong to
+
+    Returns:
+        None
+    Outputs:
+        Displays the number of particles of every species and the total mass in amu
+    """
+    counts = SPECIES.count(species)
+    print("Particles count " + when + " fission reaction")
+    for name, count in zip(SPECIES.names, counts):
+        print(name + ":", count)
+    print("Total mass " + when + " simulation: ", float(counts @ SPECIES.mass))
+
+
+def find_contacts(store, pos, fission_index, candidates):
+    """
+    Finds the fission contacts and the other contacts among candidate pairs
+
+    Parameters:
+        store (ParticleStore): The store holding the particles
+        pos (ndarray): N x 3 array of the positions(in m) to test
+        fission_index (FissionIndex): Index finding the neutron-uranium contacts
+        candidates (ndarray): M x 2 array of candidate pairs for every other contact, without neutron-uranium
+            pairs, so the narrow phase only checks the pairs the fission index does not
+
+    Returns:
+        ndarray: Rows of the neutrons undergoing fission, each with its own uranium atom
+        ndarray: Rows of the uranium atoms undergoing fission
+        ndarray: K x 2 array of the other pairs in contact
+        ndarray: K array with the distance(in m) between the particles of each of those pairs
+    """
+    # Neutron-uranium contacts come from the fission index, closest pairs react first
+    neutron_rows, uranium_rows, dist = fission_index.contactPairs(store, pos)
+    reacting = matchPairs(np.stack((neutron_rows, uranium_rows), axis=1), dist)
+    neutron_rows = neutron_rows[reacting]
+    uranium_rows = uranium_rows[reacting]
+
+    # Every other pair in contact, each unordered pair once
+    pairs, dist = contact_pairs(pos, store.species, candidates)
+    return neutron_rows, uranium_rows, pairs, dist
 
 
 # Function to run the simulation
-def run_simulation(num_neutrons, num_uranium, box_dim, dt):
+def step_simulation(
+    store,
+    num_uranium,
+    box_dim,
+    dt,
+    broadphase="auto",
+    skin=None,
+    stats=None,
+    step_control=None,
+    integrator="euler",
+    mts_ratio=1,
+    heavy_collisions="contact",
+    neutron_band=None,
+    rng=np.random,
+):
+    """
+    Advances the particles of a store with time steps until no more uranium atoms remain
+
+    With mts_ratio above 1, only neutrons move on every step. Uranium, barium and krypton atoms move once every
+    mts_ratio steps by mts_ratio * dt, and in between they are tested for contact with neutrons at the
+    position they would have along that coarse step, interpolated with their velocity. Contacts among heavy
+    atoms, and the walls for them, are only checked at the end of a coarse step.
+
+    With heavy_collisions="dsmc", collisions among heavy atoms are drawn by DSMCCollisions after every move of
+    the heavy atoms, and only pairs involving a neutron go through the contact checks.
+
+    With a neutron_band, neutrons carry statistical weights and populationControl keeps their number inside the
+    band after every step. A neutron of weight w >= 1 touching uranium stands for several neutrons: one of them
+    undergoes fission and the neutron goes on with weight w - 1. A neutron of weight w < 1 undergoes fission
+    with probability w and is used up either way. Uranium atoms always have weight 1, so every fission is real
+    and the fission count and weighted drag energy stay unbiased. Light neutrons can still all be used up
+    without fission, so the run stops once no neutron is left, with the remaining uranium unreacted.
+
+    Parameters:
+        store (ParticleStore): The store holding the particles
+        num_uranium (int): The number of uranium atoms in the store
+        box_dim (float): Half of the length of one side of the cubic box the particles will be simulated in
+        dt (float): The size of time step for updating particle's position and velocities
+        broadphase (str): Backend finding candidate collision pairs, "auto", "brute", "grid", "kdtree" or "sweep"
+        skin (float): Neighbor list skin distance(in m), defaults to a tenth of the contact distance
+        stats (dict): Optional dictionary filled with run counters
+        step_control (AdaptiveStep): Picks the size of every step, up to dt, None to always step by dt
+        integrator (str): Drag integrator of the StepKernel, "euler" or "exact"
+        mts_ratio (int): Number of neutron steps per step of the heavy atoms
+        heavy_collisions (str): "contact" to find heavy-atom collisions from contact distances, or "dsmc" to draw
+            them with DSMCCollisions
+        neutron_band (tuple): Smallest and largest number of neutrons to keep with population control, None to
+            follow every neutron with weight 1
+        rng (Generator): Random number generator, defaults to numpy's global one
+
+    Returns:
+        int: The number of fission reactions that occurred
+        float: The total amount of energy transferred(lost) to surrounding water through drag
+    """
+    if mts_ratio < 1 or int(mts_ratio) != mts_ratio:
+        raise ValueError(f"mts_ratio must be a positive integer, got {mts_ratio}")
+    if mts_ratio > 1 and step_control is not None:
+        raise ValueError("Multiple time stepping needs a fixed dt")
+    if heavy_collisions not in ("contact", "dsmc"):
+        raise ValueError(f"Unknown heavy-atom collision model: {heavy_collisions}")
+
+    num_fission_occur = 0
+    total_drag_energy = 0
+    neighbors = NeighborList(skin=skin, broadphase=broadphase)
+    fission_index = FissionIndex()
+    kernel = StepKernel(integrator)
+    dsmc = DSMCCollisions() if heavy_collisions == "dsmc" else None
+    num_split = 0
+    num_killed = 0
+    num_steps = 0
+    sim_time = 0.0
+    step_size = dt
+    # every uranium atom present undergoes fission before the run ends
+    _, fission_energy = heatRelease(num_uranium, box_dim, 0)
+
+    # time the heavy atoms are behind the neutrons, and counters of multiple time stepping
+    heavy_lag = 0.0
+    coarse_steps = 0
+    species_version = None
+
+    while num_uranium > 0:
+        # per-particle arrays only change with the population, so steps in between allocate none of them
+        if store.version != species_version:
+            species_version = store.version
+            neutron = store.species == NEUTRON
+            cutoff = 2 * SPECIES.contact_radius[SPECIES.count(store.species) > 0].max()
+            consumed = np.zeros(len(store), dtype=bool)
+            if mts_ratio > 1:
+                # multiple time stepping keeps step_size at dt
+                neutron_dt = np.where(neutron, dt, 0.0)
+                heavy = ~neutron
+                heavy_dt = np.zeros(len(store))
+                lag_pos = np.empty(store.pos.shape)
+                old_vel = np.empty(store.vel.shape)
+        # a run without neutrons could never use up its uranium
+        if not neutron.any():
+            break
+
+        if step_control is not None:
+            step_size = step_control.stepLimit(store, dt, fission_energy, total_drag_energy)
+
+        # Move every particle, collect drag energy and bounce off the walls
+        if mts_ratio == 1:
+            total_drag_energy += kernel.step(store, step_size, box_dim)
+        else:
+            # neutrons take every step, heavy atoms catch up at the end of the coarse step
+            total_drag_energy += kernel.step(store, neutron_dt, box_dim)
+            heavy_lag += step_size
+        sim_time += step_size
+
+        if mts_ratio > 1 and heavy_lag < mts_ratio * dt * (1 - 1e-9):
+            # heavy atoms are tested where they are along their coarse step, only contacts with neutrons
+            np.multiply(heavy, heavy_lag, out=heavy_dt)
+            lag = heavy_dt[:, None]
+            np.multiply(store.vel, lag, out=lag_pos)
+            lag_pos += store.pos
+            pos = lag_pos
+            candidates = neutron_pairs(pos, store.species, cutoff)
+            heavy_step = 0.0
+        else:
+            heavy_step = step_size
+            if heavy_lag > 0:
+                np.multiply(heavy, heavy_lag, out=heavy_dt)
+                total_drag_energy += kernel.step(store, heavy_dt, box_dim)
+                heavy_step = heavy_lag
+                heavy_lag = 0.0
+                coarse_steps += 1
+            lag = 0.0
+            pos = store.pos
+            if dsmc is None:
+                candidates = neighbors.candidatePairs(pos, cutoff, store.version, store.species)
+            else:
+                candidates = neutron_pairs(pos, store.species, cutoff)
+        neutron_rows, uranium_rows, pairs, dist = find_contacts(
+            store, pos, fission_index, candidates
+        )
+        if dsmc is not None and heavy_step > 0:
+            heavy_pairs, heavy_dist = dsmc.collisionPairs(store, heavy_step, box_dim, rng)
+            pairs = np.concatenate((pairs, heavy_pairs))
+            dist = np.concatenate((dist, heavy_dist))
+
+        # Only part of a light neutron reacts, as a whole with probability w
+        weight = store.weight[neutron_rows]
+        light = weight < 1
+        reacts = ~light
+        if np.any(light):
+            reacts[light] = rng.uniform(0, 1, np.count_nonzero(light)) < weight[light]
+        remaining = np.where(light, 0.0, weight - 1)
+        store.weight[neutron_rows] = remaining
+        neutron_rows = neutron_rows[remaining <= 1e-12]
+        uranium_rows = uranium_rows[reacts]
+
+        # Every fission of this step is resolved in one batch
+        product_species, product_pos, product_vel = fissionBatch(pos[uranium_rows], rng)
+        consumed[:] = False
+        consumed[neutron_rows] = True
+        consumed[uranium_rows] = True
+        num_uranium -= len(uranium_rows)
+        num_fission_occur += len(uranium_rows)
+
+        # Elastic collisions of the particles left, each particle in at most one contact per step
+        free = ~(consumed[pairs[:, 0]] | consumed[pairs[:, 1]])
+        pairs = pairs[free]
+        colliding = pairs[matchPairs(pairs, dist[free])]
+        if heavy_lag > 0:
+            np.copyto(old_vel, store.vel)
+        elasticCollisionBatch(
+            pos, store.vel, SPECIES.mass[store.species], store.species, colliding, rng
+        )
+
+        if heavy_lag > 0:
+            # heavy atoms keep their position along the coarse step when their velocity or their existence
+            # starts mid-step, so their stored position is moved back by the time they are behind
+            np.subtract(store.vel, old_vel, out=old_vel)
+            old_vel *= lag
+            store.pos[...] -= old_vel
+            heavy_products = product_species != NEUTRON
+            product_pos[heavy_products] -= product_vel[heavy_products] * heavy_lag
+
+        store.remove(np.flatnonzero(consumed))
+        store.add(product_species, product_pos, product_vel)
+        if neutron_band is not None:
+            split, killed = populationControl(store, *neutron_band, rng)
+            num_split += split
+            num_killed += killed
+        num_steps += 1
+
+    if stats is not None:
+        stats["steps"] = num_steps
+        stats["sim_time"] = sim_time
+        stats["neighbor_builds"] = neighbors.builds
+        stats["neighbor_reuses"] = neighbors.reuses
+        stats["fission_index_builds"] = fission_index.builds
+        stats["fission_index_reuses"] = fission_index.reuses
+        stats["kernel_buffer_reallocations"] = kernel.allocations
+        if step_control is not None:
+            stats["dt_min"] = step_control.dt_min
+            stats["dt_max"] = step_control.dt_max
+        if mts_ratio > 1:
+            stats["coarse_steps"] = coarse_steps
+        if dsmc is not None:
+            stats["dsmc_candidates"] = dsmc.candidates
+            stats["dsmc_collisions"] = dsmc.collisions
+        if neutron_band is not None:
+            stats["neutrons_split"] = num_split
+            stats["neutrons_killed"] = num_killed
+            stats["uranium_left"] = num_uranium
+    return num_fission_occur, total_drag_energy
+
+
+def run_simulation(
+    num_neutrons,
+    num_uranium,
+    box_dim,
+    dt,
+    broadphase="auto",
+    skin=None,
+    stats=None,
+    precision="float64",
+    engine="step",
+    rtol=None,
+    temp_tol=None,
+    integrator="euler",
+    mts_ratio=1,
+    heavy_collisions="contact",
+    neutron_band=None,
+    seed=None,
+):
     """
     Executes logic that runs entire simulation with particle and wall collisions, fission reactions and determination of mass for one simulation run (until no more Uranium objects remain)
 
@@ -62,6 +357,30 @@ def run_simulation(num_neutrons, num_uranium, box_dim, dt):
         num_uranium (int): The number of Uranium objects initially present in simulation
         box_dim (float): Half of the length of one side of the cubic box the particles will be simulated in
         dt (float): The size of time step for updating particle's position and velocities
+        broadphase (str): Backend finding candidate collision pairs, "auto", "brute", "grid", "kdtree" or "sweep"
+        skin (float): Neighbor list skin distance(in m), defaults to a tenth of the contact distance
+        stats (dict): Optional dictionary filled with run counters (steps, neighbor list and fission index builds
+            and reuses, step kernel buffer reallocations, or events for the event engine), the number of
+            fissions and the drag energy(in J)
+        precision (str): Floating point type of particle positions and velocities, "float64" or "float32"
+            (energy and temperature are accumulated in float64 either way)
+        engine (str): "step" for fixed time steps of size dt, "event" to jump from one collision to the next
+            with the EventEngine, or "transport" to sample neutron flight distances with the
+            TrackLengthTransport (dt is unused by the last two)
+        rtol (float): Relative velocity error per step, when given the step engine picks every step size up to
+            dt from it and from the contact distances, see AdaptiveStep
+        temp_tol (float): Relative tolerance on temp_change, adapts step sizes up to dt like rtol, never beyond
+            the rtol limit, and lowers the fraction of a contact distance crossed in one step to temp_tol
+        integrator (str): Drag integrator of the step engine, "euler" for the explicit update of Particle.move
+            or "exact" for the closed-form quadratic drag solution, which allows much larger dt
+        mts_ratio (int): Number of neutron steps per step of the uranium, barium and krypton atoms in the step
+            engine, 1 to move every particle on every step
+        heavy_collisions (str): How the step engine finds collisions among uranium, barium and krypton atoms,
+            "contact" from their contact distances or "dsmc" by Direct Simulation Monte Carlo
+        neutron_band (tuple): Smallest and largest number of neutrons the step engine keeps by splitting and
+            combing weighted neutrons, None to follow every neutron
+        seed (int, SeedSequence or Generator): Seed of the random numbers of the run, so the same seed gives
+            the same run, None to draw from numpy's global random state
 
     Returns:
         list: A list named particles that contains all the Particle objects in no particular order
@@ -70,71 +389,61 @@ def run_simulation(num_neutrons, num_uranium, box_dim, dt):
     """
     # Generate initial particles
     start_time = time.time()
-    particles = generate_particles(num_neutrons, num_uranium, box_dim)
-
-    # counting the number of each partcile in particles list
-    count_neutron = int(0)
-    count_uranium = int(0)
-    count_barium = int(0)
-    count_krypton = int(0)
-    for particle in particles:
-        name = particle.__class__.__name__
-        if name == "Neutron":
-            count_neutron += int(1)
-        elif name == "Uranium":
-            count_uranium += int(1)
-        elif name == "Barium":
-            count_barium += int(1)
-        elif name == "krypton":
-            count_krypton += int(1)
-    print("Particles count before fission reaction")
-    print("Neutron: ", count_neutron)
-    print("Uranium: ", count_uranium)
-    print("Barium: ", count_barium)
-    print("Krypton: ", count_krypton)
-    print(
-        "Total mass before simulation: ",
-        total_mass_particles(count_neutron, count_uranium, count_barium, count_krypton),
-    )
+    rng = np.random if seed is None else np.random.default_rng(seed)
+    store = generate_store(num_neutrons, num_uranium, box_dim, precision, rng)
+
+    # counting the number of each partcile in the store
+    print_particle_counts(store.species, "before")
     print()
 
-    num_fission_occur = 0
-    total_drag_energy = 0
+    if engine == "step":
+        step_control = None
+        if rtol is not None or temp_tol is not None:
+            step_control = AdaptiveStep(
+                rtol=1e-4 if rtol is None else rtol,
+                temp_tol=temp_tol,
+                integrator=integrator,
+            )
+        num_fission_occur, total_drag_energy = step_simulation(
+            store,
+            num_uranium,
+            box_dim,
+            dt,
+            broadphase,
+            skin,
+            stats,
+            step_control,
+            integrator,
+            mts_ratio,
+            heavy_collisions,
+            neutron_band,
+            rng,
+        )
+    elif engine == "event":
+        events = EventEngine(store, box_dim, rng)
+        num_fission_occur = events.run(num_uranium)
+        total_drag_energy = events.drag_energy
+        if stats is not None:
+            stats["events"] = events.num_events
+            stats["stale_events"] = events.num_stale
+            stats["uranium_left"] = events.uranium_left
+            stats["sim_time"] = events.time
+    elif engine == "transport":
+        transport = TrackLengthTransport(store, box_dim, rng=rng)
+        num_fission_occur = transport.run(num_uranium)
+        total_drag_energy = transport.drag_energy
+        if stats is not None:
+            stats["collisions"] = transport.num_collisions
+            stats["virtual_collisions"] = transport.num_virtual
+            stats["sim_time"] = transport.time
+    else:
+        raise ValueError(f"Unknown simulation engine: {engine}")
 
-    while num_uranium > 0:
-        # Move and check particle interactions
-        for particle in particles:
-            particle.move(drag_coeff=0.47, dt=dt)
-
-            vel = particle.getVel()
-            radius = particle.getRadius()
-            drag_energy = dragEnergy(dt, vel, radius)
-            total_drag_energy += drag_energy
-
-            particle.collideWall([box_dim, box_dim, box_dim])  # Wall collision
-
-        # Check for particle collisions and fission
-        for particle in particles:
-            for other_particle in particles:
-                particle_name = particle.__class__.__name__
-                other_particle_name = other_particle.__class__.__name__
-
-                # Check if fission occurred
-                if (
-                    particle_name == "Neutron" and other_particle_name == "Uranium"
-                ) or (particle_name == "Uranium" and other_particle_name == "Neutron"):
-                    fission_products = particle.collideParticle(other_particle)
-                    if fission_products is not None:
-                        # Update particle list to include new particles
-                        particles.extend(fission_products)
-                        particles.remove(particle)
-                        particles.remove(other_particle)
-                        num_uranium -= 1
-                        num_fission_occur += 1
-                        break
-                else:
-                    particle.collideParticle(other_particle)
+    if stats is not None:
+        stats["fissions"] = num_fission_occur
+        stats["drag_energy"] = total_drag_energy
 
+    particles = store_particles(store)
     end_time = time.time()
     total_time = end_time - start_time
 
@@ -190,27 +499,5 @@ def main():
     print("Final Water Temperature:", current_water_temp)
 
     # counting the number of each partcile in particles list after finishing the fission reaction
-    count_neutron = int(0)
-    count_uranium = int(0)
-    count_barium = int(0)
-    count_krypton = int(0)
-    for particle in particles:
-        name = particle.__class__.__name__
-        if name == "Neutron":
-            count_neutron += int(1)
-        elif name == "Uranium":
-            count_uranium += int(1)
-        elif name == "Barium":
-            count_barium += int(1)
-        elif name == "Krypton":
-            count_krypton += int(1)
-    print("Particles count after fission reaction")
-    print("Neutron:", count_neutron)
-    print("Uranium:", count_uranium)
-    print("Barium:", count_barium)
-    print("Krypton:", count_krypton)
-    print(
-        "Total mass after simulation: ",
-        total_mass_particles(count_neutron, count_uranium, count_barium, count_krypton),
-    )
+    print_particle_counts([particle.species for particle in particles], "after")
     print("Total time elapse:", total_time)
@@ -0,0 +1,85 @@
+# species table with the constants of every kind of particle in the simulation
+import numpy as np
+
+DRAG_COEFF = 0.47  # assuming spherical particles
+WATER_DENSITY = 1000  # kg/m^3 for water
+
+# Particles collide when their distance is within (r1 + r2) * CONTACT_SCALE, see Particle.collideParticle
+CONTACT_SCALE = 1.0e9
+
+
+class SpeciesTable:
+    """
+    A class holding the constants of every particle species as arrays indexed by species id, so that array
+    code can look them up for a whole population at once
+
+    Attributes:
+        names (list): The name of every species
+        mass (ndarray): The mass(in amu) of every species
+        radius (ndarray): The radius(in m) of every species
+        area (ndarray): The cross-sectional area(in m^2) of every species
+        force_prefactor (ndarray): 0.5 * Cd * rho * A, the drag force per squared speed of every species
+        drag_prefactor (ndarray): 0.5 * Cd * rho * A / m, the drag deceleration per squared speed of every species
+        contact_radius (ndarray): radius * CONTACT_SCALE, two particles touch within the sum of their contact radii
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty SpeciesTable object
+        """
+        self.names = []
+        self.mass = np.empty(0)
+        self.radius = np.empty(0)
+        self._update()
+
+    def __len__(self):
+        return len(self.names)
+
+    def _update(self):
+        """
+        Recomputes the derived constants after the table changed
+
+        Returns:
+            None
+        """
+        self.area = np.pi * self.radius**2
+        self.force_prefactor = 0.5 * DRAG_COEFF * WATER_DENSITY * self.area
+        self.drag_prefactor = self.force_prefactor / self.mass
+        self.contact_radius = self.radius * CONTACT_SCALE
+
+    def register(self, name, mass, radius):
+        """
+        Adds a species to the table
+
+        Parameters:
+            name (str): Name of the species, also used as the name of its Particle class
+            mass (float): The mass(in amu) of the species
+            radius (float): The radius(in m) of the species
+
+        Returns:
+            int: The species id of the new species
+        """
+        self.names.append(name)
+        self.mass = np.append(self.mass, float(mass))
+        self.radius = np.append(self.radius, float(radius))
+        self._update()
+        return len(self.names) - 1
+
+    def count(self, species):
+        """
+        Counts the particles of every species
+
+        Parameters:
+            species (ndarray): Species id of every particle
+
+        Returns:
+            ndarray: Number of particles of every species, indexed by species id
+        """
+        return np.bincount(np.asarray(species, dtype=np.int64), minlength=len(self))
+
+
+SPECIES = SpeciesTable()
+NEUTRON = SPECIES.register("Neutron", 1, 8.0e-16)
+URANIUM = SPECIES.register("Uranium", 235, 2.4e-10)
+BARIUM = SPECIES.register("Barium", 141, 2.68e-10)
+KRYPTON = SPECIES.register("Krypton", 92, 2.02e-10)
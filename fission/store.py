@@ -0,0 +1,232 @@
+# module for columnar particle storage
+import numpy as np
+from .species import SPECIES
+
+
+def _column(name, doc):
+    """
+    Creates a property exposing the live rows of one column of a ParticleStore
+
+    Parameters:
+        name (str): Name of the column
+        doc (str): Description of the column
+
+    Returns:
+        property: Property returning a view of the first len(store) rows of the column
+    """
+    return property(lambda self: self._columns[name][: self._size], doc=doc)
+
+
+class ParticleStore:
+    """
+    A class storing every particle of a simulation as contiguous columns. It works as a pool: every particle
+    gets a stable integer id, rows are kept in arrays whose capacity doubles when full, new particles go to the
+    end and removed particles are replaced by the last rows, so adding or removing a particle costs O(1)
+    however many particles there are. Row order is therefore not insertion order.
+
+    Attributes:
+        pos (ndarray): N x 3 array with the position(in m) of each particle
+        vel (ndarray): N x 3 array with the velocity(in m/s) of each particle
+        species (ndarray): N array with the species id of each particle
+        mass (ndarray): N array with the mass(in amu) of each particle
+        radius (ndarray): N array with the radius(in m) of each particle
+        ids (ndarray): N array with the stable id of each particle
+        weight (ndarray): N array with the statistical weight of each particle, the number of real particles
+            it stands for
+        dtype (dtype): Floating point type of the pos and vel columns
+        capacity (int): Number of rows the columns can hold before growing
+        version (int): Counter increased whenever particles are added or removed
+    """
+
+    pos = _column("pos", "N x 3 array with the position(in m) of each particle")
+    vel = _column("vel", "N x 3 array with the velocity(in m/s) of each particle")
+    species = _column("species", "N array with the species id of each particle")
+    mass = _column("mass", "N array with the mass(in amu) of each particle")
+    radius = _column("radius", "N array with the radius(in m) of each particle")
+    ids = _column("ids", "N array with the stable id of each particle")
+    weight = _column("weight", "N array with the statistical weight of each particle")
+
+    def __init__(self, capacity=16, dtype=np.float64):
+        """
+        Initializes an empty ParticleStore object
+
+        Parameters:
+            capacity (int): Number of rows to allocate up front
+            dtype (dtype): Floating point type of the pos and vel columns, float64 or float32
+        """
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float32, np.float64):
+            raise ValueError(f"Unsupported particle precision: {self.dtype}")
+        self._size = 0
+        self._next_id = 0
+        self._columns = {
+            "pos": np.empty((capacity, 3), dtype=self.dtype),
+            "vel": np.empty((capacity, 3), dtype=self.dtype),
+            "species": np.empty(capacity, dtype=np.int64),
+            "mass": np.empty(capacity),
+            "radius": np.empty(capacity),
+            "ids": np.empty(capacity, dtype=np.int64),
+            "weight": np.empty(capacity),
+        }
+        # row of every id ever handed out, -1 once the particle is removed
+        self._rows = np.full(capacity, -1, dtype=np.int64)
+        self.version = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self):
+        return len(self._columns["ids"])
+
+    def _grow(self, size):
+        """
+        Doubles the capacity of every column until it holds size rows
+
+        Parameters:
+            size (int): Number of rows needed
+
+        Returns:
+            None
+        """
+        capacity = max(self.capacity, 1)
+        while capacity < size:
+            capacity *= 2
+        for name, column in self._columns.items():
+            grown = np.empty((capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[: self._size] = column[: self._size]
+            self._columns[name] = grown
+
+    def _growIds(self, num_ids):
+        """
+        Doubles the id to row table until it holds num_ids ids
+
+        Parameters:
+            num_ids (int): Number of ids needed
+
+        Returns:
+            None
+        """
+        size = max(len(self._rows), 1)
+        while size < num_ids:
+            size *= 2
+        rows = np.full(size, -1, dtype=np.int64)
+        rows[: len(self._rows)] = self._rows
+        self._rows = rows
+
+    def add(self, species, pos, vel, weight=1.0):
+        """
+        Appends particles of the given species to the end of the store
+
+        Parameters:
+            species (int or ndarray): Species id of every new particle, or one id per particle
+            pos (ndarray): M x 3 array of positions(in m) of the new particles
+            vel (ndarray): M x 3 array of velocities(in m/s) of the new particles
+            weight (float or ndarray): Statistical weight of every new particle, or one weight per particle
+
+        Returns:
+            ndarray: M array with the ids given to the new particles
+        Outputs:
+            All columns of the store are extended by M rows
+        """
+        pos = np.asarray(pos, dtype=self.dtype).reshape(-1, 3)
+        vel = np.asarray(vel, dtype=self.dtype).reshape(-1, 3)
+        num_new = len(pos)
+        if num_new == 0:
+            return np.empty(0, dtype=np.int64)
+        species = np.broadcast_to(np.asarray(species, dtype=np.int64), num_new)
+
+        start = self._size
+        end = start + num_new
+        if end > self.capacity:
+            self._grow(end)
+        ids = np.arange(self._next_id, self._next_id + num_new)
+        if ids[-1] >= len(self._rows):
+            self._growIds(ids[-1] + 1)
+
+        columns = self._columns
+        columns["pos"][start:end] = pos
+        columns["vel"][start:end] = vel
+        columns["species"][start:end] = species
+        columns["mass"][start:end] = SPECIES.mass[species]
+        columns["radius"][start:end] = SPECIES.radius[species]
+        columns["ids"][start:end] = ids
+        columns["weight"][start:end] = weight
+        self._rows[ids] = np.arange(start, end)
+
+        self._size = end
+        self._next_id += num_new
+        self.version += 1
+        return ids
+
+    def extend(self, particles):
+        """
+        Appends Particle objects to the end of the store
+
+        Parameters:
+            particles (list): Particle objects(Neutron, Uranium, Barium or Krypton) to be stored
+
+        Returns:
+            None
+        """
+        if len(particles) == 0:
+            return
+        species = [particle.species for particle in particles]
+        pos = [np.asarray(particle.getPos(), dtype=float) for particle in particles]
+        vel = [np.asarray(particle.getVel(), dtype=float) for particle in particles]
+        self.add(species, pos, vel)
+
+    def remove(self, rows):
+        """
+        Removes particles from the store, moving the last rows into the freed rows
+
+        Parameters:
+            rows (ndarray): Rows of the particles to remove, each row at most once
+
+        Returns:
+            None
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        num_removed = len(rows)
+        if num_removed == 0:
+            return
+        new_size = self._size - num_removed
+
+        # rows freed below the new end are filled by the surviving rows past it
+        removed = np.zeros(self._size - new_size, dtype=bool)
+        tail = rows[rows >= new_size]
+        removed[tail - new_size] = True
+        holes = rows[rows < new_size]
+        movers = new_size + np.flatnonzero(~removed)
+
+        self._rows[self._columns["ids"][rows]] = -1
+        for column in self._columns.values():
+            column[holes] = column[movers]
+        self._rows[self._columns["ids"][holes]] = holes
+
+        self._size = new_size
+        self.version += 1
+
+    def rowsOf(self, ids):
+        """
+        Obtains the current rows of particles from their ids
+
+        Parameters:
+            ids (int or ndarray): Stable ids of the particles
+
+        Returns:
+            int or ndarray: Row of every particle, -1 for particles that were removed
+        """
+        return self._rows[ids]
+
+    def count(self, species):
+        """
+        Counts how many particles of one species are in the store
+
+        Parameters:
+            species (int): Species id to count
+
+        Returns:
+            int: Number of particles of that species
+        """
+        return int(np.count_nonzero(self.species == species))
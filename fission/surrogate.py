@@ -0,0 +1,285 @@
+# module for a mean-field surrogate of the simulation, rate equations calibrated against Monte Carlo runs
+import numpy as np
+from scipy.integrate import solve_ivp
+from scipy.optimize import least_squares
+from .reaction import FISSION_PRODUCTS, FISSION_PRODUCT_SPEEDS, heatRelease
+from .ensemble import run_ensemble
+from .species import SPECIES, NEUTRON, URANIUM, BARIUM, KRYPTON
+
+# Lower and upper bounds of every fitted coefficient of MeanFieldSurrogate
+COEFFICIENT_BOUNDS = {
+    "search_rate": (1e-6, 1e6),
+    "reach_volume": (1e-6, 1e3),
+    "drag_scale": (1e-3, 1e6),
+    "heating_rate": (1e-20, 1e0),
+}
+
+# Velocity component scales(in m/s) of the neutrons and uranium atoms drawn by generate_store
+NEUTRON_VELOCITY_SCALE = 50.0
+URANIUM_VELOCITY_SCALE = 10.0
+
+
+def mean_cubed_speeds(num_samples=200000):
+    """
+    Obtains the mean cubed speed of every population of the simulation, the initial neutrons and uranium atoms
+    with the exponential velocity components of generate_store and the fission neutrons and products with the
+    uniform ones of fissionBatch
+
+    Parameters:
+        num_samples (int): Number of velocities sampled for every population
+
+    Returns:
+        dict: Mean cubed speed(in m^3/s^3) of "neutron", "uranium", "fission_neutron" and "product", the last
+            averaging barium and krypton
+    """
+    rng = np.random.default_rng(0)
+
+    def cubed_speed(vel):
+        return float(np.mean(np.linalg.norm(vel, axis=1) ** 3))
+
+    neutron_speed = FISSION_PRODUCT_SPEEDS[FISSION_PRODUCTS == NEUTRON][0]
+    product_speeds = FISSION_PRODUCT_SPEEDS[FISSION_PRODUCTS != NEUTRON]
+    return {
+        "neutron": cubed_speed(rng.exponential(NEUTRON_VELOCITY_SCALE, (num_samples, 3))),
+        "uranium": cubed_speed(rng.exponential(URANIUM_VELOCITY_SCALE, (num_samples, 3))),
+        "fission_neutron": cubed_speed(rng.uniform(-1, 1, (num_samples, 3)) * neutron_speed),
+        "product": float(
+            np.mean([cubed_speed(rng.uniform(-1, 1, (num_samples, 3)) * speed) for speed in product_speeds])
+        ),
+    }
+
+
+def monte_carlo_means(points, replicas=5, seed=None, jobs=1, manifest=None, cache=None, **options):
+    """
+    Runs the particle simulation several times at every point and averages its results
+
+    Parameters:
+        points (list): (num_neutrons, num_uranium, box_dim, dt) tuples to simulate
+        replicas (int): Number of runs averaged at every point
+        seed (int or None): Root seed of the runs, None for fresh entropy from the system
+        jobs (int): Number of processes the runs are spread over
+        manifest (SweepManifest): Manifest recording the finished runs, None to keep results in memory only
+        cache (ResultCache): Cache of the results of earlier runs, None to run every replica
+        **options: Options passed on to run_simulation
+
+    Returns:
+        list: One dictionary per point with the mean temp_change, sim_time(in s) and drag_energy(in J)
+    """
+    means = []
+    for runs in run_ensemble(points, replicas, seed, jobs, manifest, cache, **options):
+        temp_change, sim_time, drag_energy = np.mean(
+            [(run["temp_change"], run["sim_time"], run["drag_energy"]) for run in runs], axis=0
+        )
+        means.append({"temp_change": temp_change, "sim_time": sim_time, "drag_energy": drag_energy})
+    return means
+
+
+class MeanFieldSurrogate:
+    """
+    A class predicting the outcome of a simulation from population balance equations instead of following
+    particles. The populations are the uranium atoms U, the initial neutrons Ni, the fission neutrons Nf and
+    the fission products P(barium and krypton atoms).
+
+    A neutron searching a volume V at the rate a finds one of the U uranium atoms after V / (a * U) on average.
+    The step engine sees the contact at the end of that step and lets a neutron react once per step, so a
+    population in contact with plenty of uranium triples every step, which the rate equations reproduce with a
+    delay of 2 * dt / ln(3). Every neutron then undergoes fission at the rate f = 1 / (V / (a * U) + 2 * dt /
+    ln(3)), and every fission turns the neutron and its uranium atom into 3 fission neutrons and 2 products:
+
+        dU/dt = -f * N,  dNi/dt = -f * Ni,  dNf/dt = 3 * f * Ni + 2 * f * Nf,  dP/dt = 2 * f * N
+
+    with N = Ni + Nf. The particles start bunched up in one corner and their contact distances are a sizeable
+    part of the box, so neutrons only search the part of the box outside the volume b already within their
+    reach: V = L^3 - b for a box of side L, down to a thousandth of L^3.
+
+    Drag heats the water at the rate sum(F * <|v|^3> * count) over the populations, F being the drag force per
+    squared speed of the species and <|v|^3> its mean cubed speed when it is created (see mean_cubed_speeds).
+    Collisions speed a few heavy atoms up far beyond their initial speed as the run goes on, so on top of the
+    heavy atoms' own heating, scaled by a factor c, drag heats the water with a power G that grows at the rate h
+    from 0.
+
+    The equations are integrated with solve_ivp until less than half a uranium atom is left. Every uranium atom
+    undergoes fission, as in the simulation, and the drag energy and fission count give temp_change through
+    heatRelease. A prediction takes a few milliseconds, so dense sweeps can be filled in without running the
+    particle simulation at every point.
+
+    Attributes:
+        search_rate (float): Volume a(in m^3/s) a neutron searches for uranium every second
+        reach_volume (float): Volume b(in m^3) within the reach of neutrons from the start
+        drag_scale (float): Factor c applied to the drag heating of the heavy atoms
+        heating_rate (float): Rate h(in W/s) at which the drag heating of atoms sped up by collisions grows
+    """
+
+    def __init__(self, search_rate=10.0, reach_volume=0.1, drag_scale=1.0, heating_rate=1e-9):
+        """
+        Initializes a MeanFieldSurrogate object, the defaults being starting guesses for calibrate
+
+        Parameters:
+            search_rate (float): Volume a(in m^3/s) a neutron searches for uranium every second
+            reach_volume (float): Volume b(in m^3) within the reach of neutrons from the start
+            drag_scale (float): Factor c applied to the drag heating of the heavy atoms
+            heating_rate (float): Rate h(in W/s) at which the drag heating of atoms sped up by collisions grows
+        """
+        self.search_rate = search_rate
+        self.reach_volume = reach_volume
+        self.drag_scale = drag_scale
+        self.heating_rate = heating_rate
+
+        speeds = mean_cubed_speeds()
+        force = SPECIES.force_prefactor
+        # drag power(in W) of one particle of each population, in the order of the state
+        self._powers = np.array(
+            [
+                force[URANIUM] * speeds["uranium"],
+                force[NEUTRON] * speeds["neutron"],
+                force[NEUTRON] * speeds["fission_neutron"],
+                0.5 * (force[BARIUM] + force[KRYPTON]) * speeds["product"],
+            ]
+        )
+        self._heavy = np.array([True, False, False, True])
+
+    def _rates(self, t, y, box_volume, dt):
+        """
+        Right-hand side of the population balance equations
+
+        Parameters:
+            t (float): Simulated time(in s), unused as the rates do not depend on it
+            y (ndarray): Current U, Ni, Nf and P counts, collision heating G(in W) and drag energy(in J)
+            box_volume (float): Volume(in m^3) of the box
+            dt (float): The size of time step(in s) of the step engine
+
+        Returns:
+            ndarray: Time derivative of y
+        """
+        uranium, initial, fission, products, heating, energy = y
+        volume = max(box_volume - self.reach_volume, 1e-3 * box_volume)
+        search = self.search_rate * max(uranium, 0.0)
+        rate = search / (volume + search * 2 * dt / np.log(3))
+        powers = self._powers * y[:4]
+        return np.array(
+            [
+                -rate * (initial + fission),
+                -rate * initial,
+                rate * (3 * initial + 2 * fission),
+                2 * rate * (initial + fission),
+                self.heating_rate,
+                self.drag_scale * powers[self._heavy].sum() + powers[~self._heavy].sum() + heating,
+            ]
+        )
+
+    def predict(self, num_neutrons, num_uranium, box_dim, dt):
+        """
+        Predicts the mean outcome of a simulation
+
+        Parameters:
+            num_neutrons (int): The number of neutrons initially present in simulation
+            num_uranium (int): The number of uranium atoms initially present in simulation
+            box_dim (float): Half of the length of one side of the cubic box
+            dt (float): The size of time step(in s) of the step engine
+
+        Returns:
+            dict: The predicted temp_change, sim_time(in s) and drag_energy(in J)
+        """
+        box_volume = (2 * box_dim) ** 3
+        y0 = np.array([num_uranium, num_neutrons, 0.0, 0.0, 0.0, 0.0])
+        time, drag_energy, num_fission = 0.0, 0.0, 0
+        if num_uranium > 0 and num_neutrons > 0:
+            # with only the initial neutrons and half a uranium atom left the last atom would take
+            # 1 / (f * N0) on average, twice the number of atoms of that bounds the whole run
+            slowest = num_neutrons / (box_volume / (0.5 * self.search_rate) + 2 * dt)
+            t_max = 2 * num_uranium / slowest
+
+            def last_uranium(t, y, box_volume, dt):
+                return y[0] - 0.5
+
+            last_uranium.terminal = True
+            solution = solve_ivp(
+                self._rates, (0.0, t_max), y0, events=last_uranium, args=(box_volume, dt), rtol=1e-4
+            )
+            time, drag_energy, num_fission = solution.t[-1], solution.y[5, -1], num_uranium
+
+        temp_change, fission_energy = heatRelease(num_fission, box_dim, drag_energy)
+        return {"temp_change": temp_change, "sim_time": time, "drag_energy": drag_energy}
+
+    def sweep(self, points):
+        """
+        Predicts the mean outcome of a simulation at every point of a sweep
+
+        Parameters:
+            points (list): (num_neutrons, num_uranium, box_dim, dt) tuples
+
+        Returns:
+            dict: Arrays of the predicted temp_change, sim_time(in s) and drag_energy(in J), one entry per point
+        """
+        predictions = [self.predict(*point) for point in points]
+        return {key: np.array([p[key] for p in predictions]) for key in ("temp_change", "sim_time", "drag_energy")}
+
+    def _fit(self, names, key, points, means):
+        """
+        Fits some coefficients by least squares on the logarithm of one result, which spans orders of
+        magnitude across a sweep, the other coefficients staying as they are
+
+        Parameters:
+            names (tuple): Names of the coefficients to fit
+            key (str): Result to match, "sim_time" or "drag_energy"
+            points (list): (num_neutrons, num_uranium, box_dim, dt) tuples
+            means (list): Results of monte_carlo_means at the points
+
+        Returns:
+            OptimizeResult: The result of least_squares
+        """
+        target = np.log([m[key] for m in means])
+        bounds = np.log([COEFFICIENT_BOUNDS[name] for name in names]).T
+
+        def residuals(log_coefficients):
+            for name, value in zip(names, np.exp(log_coefficients)):
+                setattr(self, name, value)
+            return np.log(self.sweep(points)[key]) - target
+
+        start = np.clip(np.log([getattr(self, name) for name in names]), bounds[0], bounds[1])
+        result = least_squares(residuals, start, bounds=bounds)
+        residuals(result.x)
+        return result
+
+    def calibrate(self, points, replicas=5, means=None, **options):
+        """
+        Fits the coefficients to Monte Carlo runs. The search rate and reach volume are fitted to the simulated
+        times first, as they alone set them, then the drag factor and heating rate to the drag energies.
+
+        Parameters:
+            points (list): (num_neutrons, num_uranium, box_dim, dt) tuples to simulate
+            replicas (int): Number of runs averaged at every point
+            means (list): Results of monte_carlo_means at the points, run here when None
+            **options: Options passed on to monte_carlo_means, seed and jobs included
+
+        Returns:
+            float: Root mean square error of the logarithm of the simulated times over the points
+            float: Root mean square error of the logarithm of the drag energies over the points
+        """
+        if means is None:
+            means = monte_carlo_means(points, replicas, **options)
+        time_fit = self._fit(("search_rate", "reach_volume"), "sim_time", points, means)
+        drag_fit = self._fit(("drag_scale", "heating_rate"), "drag_energy", points, means)
+        return float(np.sqrt(np.mean(time_fit.fun**2))), float(np.sqrt(np.mean(drag_fit.fun**2)))
+
+    def heldOutError(self, points, replicas=5, means=None, **options):
+        """
+        Compares predictions with Monte Carlo runs at points left out of the calibration
+
+        Parameters:
+            points (list): (num_neutrons, num_uranium, box_dim, dt) tuples to simulate
+            replicas (int): Number of runs averaged at every point
+            means (list): Results of monte_carlo_means at the points, run here when None
+            **options: Options passed on to monte_carlo_means, seed and jobs included
+
+        Returns:
+            dict: Mean absolute relative error of temp_change, sim_time and drag_energy over the points
+        """
+        if means is None:
+            means = monte_carlo_means(points, replicas, **options)
+        predicted = self.sweep(points)
+        errors = {}
+        for key, values in predicted.items():
+            measured = np.array([m[key] for m in means])
+            errors[key] = float(np.mean(np.abs(values - measured) / np.abs(measured)))
+        return errors
@@ -0,0 +1,141 @@
+# test module, run with python -m pytest
+import numpy as np
+import pytest
+from .batched import run_batch
+from .broadphase import BROADPHASES
+from .ensemble import run_ensemble
+from .manifest import SweepManifest
+from .reaction import matchPairs
+from .simulation import run_simulation
+from .species import NEUTRON, URANIUM
+from .store import ParticleStore
+
+# small simulations that finish in a fraction of a second
+POINTS = [(4, 2, 0.5, 1e-3), (3, 3, 0.5, 1e-3)]
+
+
+def _without_timing(runs):
+    """
+    Drops the wall-clock time from run summaries, the only part of a seeded run that changes between runs
+
+    Parameters:
+        runs (list): One list per point of the run_replica summary of each of its replicas
+
+    Returns:
+        list: The same summaries without total_time
+    """
+    return [
+        [{key: value for key, value in run.items() if key != "total_time"} for run in point] for point in runs
+    ]
+
+
+def test_store_ids_follow_particles():
+    """ParticleStore keeps every id on its particle's row through adds and removes"""
+    rng = np.random.default_rng(0)
+    store = ParticleStore(capacity=4)
+    ids = store.add(URANIUM, rng.uniform(-1, 1, (10, 3)), np.zeros((10, 3)))
+    position = dict(zip(ids.tolist(), store.pos.copy()))
+    removed = []
+
+    for _ in range(20):
+        version = store.version
+        rows = rng.choice(len(store), rng.integers(1, 4), replace=False)
+        removed.extend(store.ids[rows].tolist())
+        store.remove(rows)
+        new_pos = rng.uniform(-1, 1, (3, 3))
+        new_ids = store.add(NEUTRON, new_pos, np.zeros((3, 3)))
+        position.update(zip(new_ids.tolist(), new_pos))
+        assert store.version == version + 2
+
+        assert len(np.unique(store.ids)) == len(store)
+        assert np.array_equal(store.rowsOf(store.ids), np.arange(len(store)))
+        assert np.all(store.rowsOf(np.array(removed)) == -1)
+        for particle_id, row in zip(store.ids.tolist(), range(len(store))):
+            assert np.array_equal(store.pos[row], position[particle_id])
+
+
+def test_match_pairs_is_sequential_greedy():
+    """matchPairs picks the pairs a sequential greedy pass in order of key, then indices, would pick"""
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        pairs = np.sort(rng.choice(30, (60, 2)), axis=1)
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        # few distinct keys, so ties are broken by the indices
+        key = rng.integers(0, 5, len(pairs)).astype(float)
+
+        taken = set()
+        expected = []
+        for index in np.lexsort((pairs[:, 1], pairs[:, 0], key)):
+            i, j = pairs[index]
+            if i not in taken and j not in taken:
+                taken.update((i, j))
+                expected.append(index)
+
+        assert matchPairs(pairs, key).tolist() == expected
+
+
+def test_broadphase_backends_agree():
+    """Every broadphase backend finds the same pairs within the cutoff as testing every pair"""
+    rng = np.random.default_rng(2)
+    pos = rng.uniform(-0.5, 0.5, (400, 3))
+    cutoff = 0.08
+    i, j = np.triu_indices(len(pos), 1)
+    close = np.linalg.norm(pos[i] - pos[j], axis=1) <= cutoff
+    expected = set(zip(i[close].tolist(), j[close].tolist()))
+
+    for name, backend in BROADPHASES.items():
+        pairs = backend().candidatePairs(pos, cutoff)
+        assert np.all(pairs[:, 0] < pairs[:, 1]), name
+        dist = np.linalg.norm(pos[pairs[:, 0]] - pos[pairs[:, 1]], axis=1)
+        found = set(map(tuple, pairs[dist <= cutoff].tolist()))
+        assert found == expected, name
+
+
+def test_ensemble_same_results_for_any_jobs():
+    """A seeded sweep gives the same results in one process as spread over several"""
+    serial = run_ensemble(POINTS, 3, seed=7, jobs=1)
+    parallel = run_ensemble(POINTS, 3, seed=7, jobs=2)
+    assert _without_timing(serial) == _without_timing(parallel)
+
+
+def test_manifest_resumes_sweep(tmp_path):
+    """A sweep started again with its manifest runs only what is missing and matches an uninterrupted one"""
+    path = str(tmp_path / "sweep.jsonl")
+    with SweepManifest(path) as manifest:
+        # the sweep stops after its first point
+        first = run_ensemble(POINTS[:1], 3, seed=3, manifest=manifest)
+    with SweepManifest(path) as manifest:
+        assert manifest.num_loaded == 3
+        resumed = run_ensemble(POINTS, 3, seed=3, manifest=manifest)
+        assert manifest.num_recorded == 3
+
+    # the first point is read back, timing included, rather than run again
+    assert resumed[0] == first[0]
+    assert _without_timing(resumed) == _without_timing(run_ensemble(POINTS, 3, seed=3))
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {},
+        {"rtol": 1e-3},
+        {"mts_ratio": 2},
+        {"heavy_collisions": "dsmc"},
+        {"neutron_band": (2, 4)},
+        {"engine": "event"},
+        {"engine": "transport"},
+    ],
+)
+def test_engines_stop_without_neutrons(options):
+    """Every engine returns at once from a run without neutrons, no fission taking place"""
+    stats = {}
+    particles, temp_change, total_time = run_simulation(0, 3, 0.5, 1e-3, stats=stats, seed=0, **options)
+    assert stats["fissions"] == 0
+    assert len(particles) == 3
+
+
+def test_batched_engine_stops_without_neutrons():
+    """The batched engine drops replicas without neutrons instead of stepping them forever"""
+    temp_change, steps, total_time = run_batch(0, 3, 0.5, 1e-3, 4, seed=0)
+    assert np.all(steps == 0)
+    assert np.all(temp_change == 0.0)
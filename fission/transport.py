@@ -0,0 +1,244 @@
+# track-length neutron transport, sampling flight distances instead of checking contacts every step
+import heapq
+import numpy as np
+from .kernels import dragFlight
+from .reaction import fissionBatch
+from .species import SPECIES, NEUTRON, URANIUM
+
+
+def gridCells(pos, box_dim, cells):
+    """
+    Obtains the cubic grid cells holding some positions, positions outside the box going to the nearest cell
+
+    Parameters:
+        pos (ndarray): N x 3 array of positions(in m)
+        box_dim (float): Half of the length of one side of the cubic box
+        cells (int): Number of grid cells along each axis
+
+    Returns:
+        ndarray: N array with the flat index of the cell of every position
+    """
+    index = np.clip(((pos + box_dim) // (2 * box_dim / cells)).astype(np.int64), 0, cells - 1)
+    return (index[:, 0] * cells + index[:, 1]) * cells + index[:, 2]
+
+
+def foldTracks(pos, vel, box_dim):
+    """
+    Folds straight neutron tracks that left the box back into it, as if the neutrons had been reflected by
+    every wall they crossed, as checked in Particle.collideWall
+
+    Parameters:
+        pos (ndarray): N x 3 array of positions(in m) reached along straight tracks
+        vel (ndarray): N x 3 array of velocities(in m/s) along those tracks
+        box_dim (float): Half of the length of one side of the cubic box
+
+    Returns:
+        None
+    Outputs:
+        pos and vel are updated in place, every wall crossed flips one velocity component
+    """
+    limit = box_dim - SPECIES.radius[NEUTRON] * np.array([1.0, 1.0, 1.0e3])
+    shifted = pos + limit
+    folded = np.mod(shifted, 4 * limit)
+    pos[:] = np.where(folded > 2 * limit, 4 * limit - folded, folded) - limit
+    crossings = np.floor(shifted / (2 * limit))
+    vel[:] = np.where(crossings % 2 == 1, -vel, vel)
+
+
+class TrackLengthTransport:
+    """
+    A class moving neutrons from one fission to the next by sampling their free-flight distance, as neutron
+    transport codes do, instead of checking neutron-uranium distances every time step. Uranium atoms are held in
+    place and binned into a grid of cells. A neutron sees the macroscopic cross-section n * sigma of every cell,
+    with n the number density of uranium and sigma = pi * d^2 for the neutron-uranium contact distance d of
+    Particle.collideParticle, so a neutron crossing a cell undergoes fission as often as it would touch one of
+    its atoms.
+
+    Flights are sampled with Woodcock delta tracking: distances follow the largest cross-section of any cell
+    when the flight starts, and a tentative collision in a cell is real with probability sigma_cell / sigma_max.
+    Cross-sections only fall as uranium is used up, so that bound holds for the whole flight. Neutrons are
+    processed in time order from a priority queue, so fission products start from the time of the fission.
+    Walls reflect neutrons, and drag along each track is integrated exactly (see dragFlight).
+
+    Only fission is sampled: neutrons fly straight through each other and through the barium and krypton
+    atoms, which are added where their uranium atom was and stay there. Held in place as they are, uranium,
+    barium and krypton atoms keep their velocities, which drag slows down as in the step engine, and their drag
+    energy is integrated exactly up to every fission, so temp_change counts the drag of every particle.
+
+    Attributes:
+        store (ParticleStore): The store holding the particles
+        box_dim (float): Half of the length of one side of the cubic box
+        cells (int): Number of grid cells along each axis
+        cross_section (float): Microscopic fission cross-section(in m^2) of a uranium atom
+        time (float): The simulated time(in s) reached so far
+        num_collisions (int): Number of real collisions, each a fission
+        num_virtual (int): Number of tentative collisions rejected by delta tracking
+        drag_energy (float): Energy(in J) transferred to the water by drag so far, neutrons and heavy atoms
+    """
+
+    def __init__(self, store, box_dim, cells=None, rng=np.random):
+        """
+        Initializes a TrackLengthTransport object
+
+        Parameters:
+            store (ParticleStore): The store holding the particles
+            box_dim (float): Half of the length of one side of the cubic box
+            cells (int): Number of grid cells along each axis, defaults to about one neutron-uranium contact
+                distance per cell and at most 32
+            rng (Generator): Random number generator, defaults to numpy's global one
+        """
+        contact = SPECIES.contact_radius
+        if cells is None:
+            cells = int(np.clip(2 * box_dim / (contact[NEUTRON] + contact[URANIUM]), 1, 32))
+        self.store = store
+        self.box_dim = box_dim
+        self.cells = cells
+        self.rng = rng
+        self.cross_section = np.pi * (contact[NEUTRON] + contact[URANIUM]) ** 2
+        self.time = 0.0
+        self.num_collisions = 0
+        self.num_virtual = 0
+        self.drag_energy = 0.0
+        self._heavy_time = 0.0
+        self._queue = []
+        self._sequence = 0
+        self._cell_size = 2 * box_dim / cells
+        self._cell_volume = self._cell_size**3
+
+        # ids of the uranium atoms in every cell, and each cell's macroscopic cross-section
+        self._members = {}
+        self._sigma = np.zeros(cells**3)
+        for row in np.flatnonzero(store.species == URANIUM):
+            cell = self._cellOf(store.pos[row])
+            self._members.setdefault(cell, []).append(int(store.ids[row]))
+            self._sigma[cell] += self.cross_section / self._cell_volume
+
+    def _cellOf(self, pos):
+        """
+        Obtains the grid cell holding a position
+
+        Parameters:
+            pos (ndarray): Position(in m)
+
+        Returns:
+            int: Flat index of the cell
+        """
+        return int(gridCells(pos[None, :], self.box_dim, self.cells)[0])
+
+    def _schedule(self, particle_id):
+        """
+        Samples the next tentative collision of a neutron and queues it
+
+        Parameters:
+            particle_id (int): Stable id of the neutron
+
+        Returns:
+            None
+        """
+        store = self.store
+        row = store.rowsOf(particle_id)
+        speed = np.linalg.norm(store.vel[row])
+        majorant = self._sigma.max()
+        if majorant <= 0 or speed <= 0:
+            return
+        distance = -np.log1p(-self.rng.uniform()) / majorant
+
+        # quadratic drag covers the distance ln(1 + k * s0 * t) / k in the time t = (exp(k * d) - 1) / (k * s0)
+        k = SPECIES.drag_prefactor[NEUTRON]
+        flight_time = np.expm1(k * distance) / (k * speed)
+        event = (self.time + flight_time, self._sequence, particle_id, flight_time, majorant)
+        heapq.heappush(self._queue, event)
+        self._sequence += 1
+
+    def _fly(self, row, flight_time):
+        """
+        Moves a neutron along its track, reflecting it at the walls, and collects its drag energy
+
+        Parameters:
+            row (int): Row of the neutron in the store
+            flight_time (float): Time(in s) of the flight
+
+        Returns:
+            None
+        """
+        store = self.store
+        pos = store.pos[row : row + 1]
+        vel = store.vel[row : row + 1]
+        self.drag_energy += dragFlight(pos, vel, store.species[row : row + 1], flight_time)
+        foldTracks(pos, vel, self.box_dim)
+
+    def _dragHeavy(self):
+        """
+        Collects the drag energy of the uranium, barium and krypton atoms from the time it was last collected to
+        the current time, slowing them down but leaving them in place
+
+        Returns:
+            None
+        """
+        store = self.store
+        heavy = np.flatnonzero(store.species != NEUTRON)
+        if len(heavy) > 0 and self.time > self._heavy_time:
+            vel = store.vel[heavy]
+            self.drag_energy += dragFlight(
+                store.pos[heavy].copy(), vel, store.species[heavy], self.time - self._heavy_time
+            )
+            store.vel[heavy] = vel
+        self._heavy_time = self.time
+
+    def _fission(self, row, cell):
+        """
+        Picks the uranium atom of a cell a neutron reacts with and resolves the fission
+
+        Parameters:
+            row (int): Row of the neutron in the store
+            cell (int): Flat index of the cell the collision happens in
+
+        Returns:
+            None
+        """
+        store = self.store
+        members = self._members[cell]
+        uranium_id = members.pop(min(int(self.rng.uniform() * len(members)), len(members) - 1))
+        self._sigma[cell] = len(members) * self.cross_section / self._cell_volume
+        uranium_row = store.rowsOf(uranium_id)
+
+        species, pos, vel = fissionBatch(store.pos[[uranium_row]], self.rng)
+        store.remove([row, uranium_row])
+        new_ids = store.add(species, pos, vel)
+        for particle_id in new_ids[species == NEUTRON]:
+            self._schedule(int(particle_id))
+
+    def run(self, num_uranium):
+        """
+        Processes neutron collisions until every uranium atom has undergone fission
+
+        Parameters:
+            num_uranium (int): The number of uranium atoms left in the store
+
+        Returns:
+            int: The number of fission reactions that occurred
+        """
+        store = self.store
+        num_fission = 0
+        for particle_id in store.ids[store.species == NEUTRON]:
+            self._schedule(int(particle_id))
+
+        while num_uranium > 0 and self._queue:
+            time, _, particle_id, flight_time, majorant = heapq.heappop(self._queue)
+            row = store.rowsOf(particle_id)
+            self._fly(row, flight_time)
+            self.time = time
+
+            cell = self._cellOf(store.pos[row])
+            if self.rng.uniform() * majorant >= self._sigma[cell]:
+                self.num_virtual += 1
+                self._schedule(int(particle_id))
+                continue
+            self.num_collisions += 1
+            # the heavy atoms change with the fission, so their drag is collected up to it
+            self._dragHeavy()
+            self._fission(row, cell)
+            num_uranium -= 1
+            num_fission += 1
+
+        return num_fission